@@ -13,7 +13,10 @@ def create_app(config_class=Config):
     db.init_app(app)
     migrate.init_app(app, db)
     
-    from app.blueprints import auth, main, tasks, magazines, ads, cxo
+    from app import events
+    events.init_app(app)
+    
+    from app.blueprints import auth, main, tasks, magazines, ads, cxo, uploads
     
     app.register_blueprint(auth.bp)
     app.register_blueprint(main.bp)
@@ -21,7 +24,17 @@ def create_app(config_class=Config):
     app.register_blueprint(magazines.bp)
     app.register_blueprint(ads.bp)
     app.register_blueprint(cxo.bp)
+    app.register_blueprint(uploads.bp)
+    
+    from app import commands
+    
+    app.cli.add_command(commands.stats_cli)
+    app.cli.add_command(commands.articles_cli)
+    app.cli.add_command(commands.notifications_cli)
+    app.cli.add_command(commands.uploads_cli)
+    app.cli.add_command(commands.blobs_cli)
+    app.cli.add_command(commands.previews_cli)
     
     return app
 
-from app import models
+from app import models, search, stats, identity, notifications, events, routing, blobs, previews
@@ -0,0 +1,363 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, func, select, text, union_all
+from sqlalchemy.orm import Session
+from app import db, upserts
+from app.models import Blob, TaskFile, CXOArticleFile, Ad
+
+# Uploaded files are kept once per distinct content, named by SHA-256, however
+# many task files, CXO article files and ads carry the same bytes. store()
+# hashes an upload while copying it in and takes a reference for the row about
+# to point at it; deleting such a row gives the reference back, and
+# `flask blobs gc` removes blobs nothing references any more.
+#
+# Files are spread over two levels of directories named by the first hex
+# digits of their SHA-256 (ab/cd/abcd...), so no directory grows past a few
+# hundred entries however many files there are. `flask blobs shard` moves
+# files stored before that, flat in BLOB_FOLDER or in the old per-kind upload
+# folders, while the app keeps running.
+
+# Rows that point at a blob through blob_sha256
+REFERENCING_MODELS = (TaskFile, CXOArticleFile, Ad)
+
+# Where uploads were saved, under UPLOAD_FOLDER, before the blob store
+LEGACY_FOLDERS = ('tasks', 'cxo_articles', 'ads')
+
+# Bytes read from an upload at a time while hashing and copying it
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Seconds after which a file still waiting beside the blobs for its commit was
+# left by a process that died; gc then puts it in place or removes it
+PENDING_EXPIRY_SECONDS = 3600
+
+# Files moved per transaction by `flask blobs shard`
+SHARD_BATCH_SIZE = 500
+
+# A blob or preview left in the flat layout: its SHA-256, then any extension
+FLAT_NAME = re.compile(r'^([0-9a-f]{64})(\.\w+)?$')
+
+
+def shard_path(folder, sha256, name=None):
+    return os.path.join(folder, sha256[:2], sha256[2:4], name or sha256)
+
+
+def path_for(sha256):
+    return shard_path(current_app.config['BLOB_FOLDER'], sha256)
+
+
+def stored_path(sha256):
+    """Where the blob's file is now: path_for(), or flat in BLOB_FOLDER until `flask blobs shard` moves it."""
+    path = path_for(sha256)
+    if not os.path.exists(path):
+        flat = os.path.join(current_app.config['BLOB_FOLDER'], sha256)
+        if os.path.exists(flat):
+            return flat
+    return path
+
+
+def _spool(file):
+    """Copy a FileStorage into a temporary file beside the blobs, hashing as it goes."""
+    folder = current_app.config['BLOB_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.incoming-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for block in iter(lambda: file.stream.read(COPY_BUFFER_SIZE), b''):
+                out.write(block)
+                digest.update(block)
+                size += len(block)
+        os.chmod(tmp, 0o644)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp, digest.hexdigest(), size
+
+
+def _add_reference(connection, sha256, size):
+    row = {'sha256': sha256, 'size': size, 'ref_count': 1, 'created_at': datetime.utcnow()}
+    upserts.add(connection, Blob.__table__, ['sha256'], [row], ['ref_count'])
+
+
+def store(file):
+    """Put an upload into the store and return its Blob, with one more reference taken.
+
+    ``file`` is a FileStorage or a CompletedUpload, which was already hashed as
+    it was assembled. The reference belongs to the row the caller adds in the
+    same transaction, pointing at the blob with blob_sha256 and file_path.
+
+    A new file only takes its place in the store once the transaction commits;
+    until then it waits beside the blobs, and a rollback removes it again (or,
+    for a CompletedUpload, hands it back to the upload).
+    """
+    if getattr(file, 'sha256', None):
+        tmp, sha256, size = None, file.sha256, file.size
+    else:
+        tmp, sha256, size = _spool(file)
+
+    # Taking the reference holds the blob's row until commit, so a concurrent gc
+    # either finishes removing the file before the check below or keeps it.
+    _add_reference(db.session.connection(), sha256, size)
+    if os.path.exists(path_for(sha256)):
+        if tmp:
+            os.remove(tmp)
+        else:
+            file.discard()
+    elif tmp:
+        pending = _pending_path(sha256)
+        os.rename(tmp, pending)
+        _place_after_commit(pending, sha256)
+    else:
+        pending = _pending_path(sha256)
+        file.save(pending)
+        _place_after_commit(pending, sha256, restore=file.part_path)
+    return db.session.get(Blob, sha256)
+
+
+def _pending_path(sha256):
+    return os.path.join(current_app.config['BLOB_FOLDER'], f'.pending-{sha256}-{uuid.uuid4().hex}')
+
+
+def _place_after_commit(pending, sha256, restore=None):
+    db.session.info.setdefault('pending_blobs', []).append((pending, path_for(sha256), restore))
+
+
+@event.listens_for(Session, 'after_commit')
+def _place_pending(session):
+    for pending, path, _ in session.info.pop('pending_blobs', ()):
+        if os.path.exists(path):
+            os.remove(pending)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(pending, path)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    for pending, _, restore in session.info.pop('pending_blobs', ()):
+        if restore:
+            os.replace(pending, restore)
+        else:
+            os.remove(pending)
+
+
+def _place(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    # A hard link costs no space while both names exist; copy across filesystems
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(COPY_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def store_file(path):
+    """Like store(), for a file already on disk, which is linked in and left in place."""
+    sha256 = _hash_file(path)
+    _add_reference(db.session.connection(), sha256, os.path.getsize(path))
+    if not os.path.exists(path_for(sha256)):
+        pending = _pending_path(sha256)
+        _place(path, pending)
+        _place_after_commit(pending, sha256)
+    return db.session.get(Blob, sha256)
+
+
+def _release(mapper, connection, target):
+    if target.blob_sha256:
+        connection.execute(
+            Blob.__table__.update().where(Blob.__table__.c.sha256 == target.blob_sha256).values(
+                ref_count=Blob.__table__.c.ref_count - 1
+            )
+        )
+
+
+for _model in REFERENCING_MODELS:
+    event.listen(_model, 'after_delete', _release)
+
+
+def recount():
+    """Recompute every blob's ref_count from the rows pointing at it, e.g. after bulk deletes."""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        # Wait for uploads in flight, whose references are counted but whose rows aren't visible yet
+        connection.execute(text('LOCK TABLE blobs IN EXCLUSIVE MODE'))
+    references = union_all(*[
+        select(model.blob_sha256.label('sha256')) for model in REFERENCING_MODELS
+    ]).subquery()
+    counted = select(func.count()).where(references.c.sha256 == Blob.sha256).scalar_subquery()
+    db.session.execute(db.update(Blob).values(ref_count=counted))
+    db.session.commit()
+
+
+def _sweep_pending():
+    folder = current_app.config['BLOB_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    cutoff = time.time() - PENDING_EXPIRY_SECONDS
+    with os.scandir(folder) as entries:
+        stale = [
+            entry for entry in entries
+            if entry.name.startswith(('.pending-', '.incoming-')) and entry.stat().st_ctime < cutoff
+        ]
+    for entry in stale:
+        sha256 = entry.name.split('-')[1] if entry.name.startswith('.pending-') else None
+        # Committed, but the process died before moving the file in
+        if sha256 and db.session.get(Blob, sha256) and not os.path.exists(path_for(sha256)):
+            os.makedirs(os.path.dirname(path_for(sha256)), exist_ok=True)
+            os.replace(entry.path, path_for(sha256))
+        else:
+            os.remove(entry.path)
+    db.session.commit()
+
+
+def collect_garbage():
+    """Delete unreferenced blobs and their files, previews included. Returns (blobs, bytes) removed."""
+    from app import previews
+    _sweep_pending()
+    removed = freed = 0
+    candidates = db.session.execute(select(Blob.sha256, Blob.size).where(Blob.ref_count <= 0)).all()
+    db.session.commit()
+    for sha256, size in candidates:
+        deleted = db.session.execute(
+            db.delete(Blob).where(Blob.sha256 == sha256, Blob.ref_count <= 0)
+        ).rowcount
+        if deleted:
+            # Before the commit: a store() of the same bytes is waiting on this row and writes the file afresh
+            for path in (path_for(sha256), previews.path_for(sha256)):
+                if os.path.exists(path):
+                    os.remove(path)
+            removed += 1
+            freed += size
+        db.session.commit()
+    return removed, freed
+
+
+def remove_originals():
+    """Delete files in the pre-store upload folders that no row points at any more and whose
+    content is committed to the store. Returns (files, bytes) removed."""
+    removed = freed = 0
+    for name in LEGACY_FOLDERS:
+        folder = os.path.join(current_app.config['UPLOAD_FOLDER'], name)
+        if not os.path.isdir(folder):
+            continue
+        with os.scandir(folder) as entries:
+            paths = sorted(entry.path for entry in entries if entry.is_file())
+        for path in paths:
+            if _still_used(path):
+                continue
+            sha256 = _hash_file(path)
+            if db.session.get(Blob, sha256) is None or not os.path.isfile(stored_path(sha256)):
+                continue
+            size = os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+            freed += size
+        db.session.commit()
+    return removed, freed
+
+
+def _flat_files(folder):
+    if not os.path.isdir(folder):
+        return []
+    found = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            match = FLAT_NAME.match(entry.name)
+            if match and entry.is_file():
+                found.append((match.group(1), entry.name))
+    return sorted(found)
+
+
+def _batches(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def _still_used(path):
+    return any(
+        db.session.query(model.id).filter(model.file_path == path).first() for model in REFERENCING_MODELS
+    )
+
+
+def shard(batch_size=SHARD_BATCH_SIZE, pause=0.0):
+    """Move files stored before the sharded layout into it, one transaction per batch.
+
+    Yields (kind, count) after each batch: 'blobs' and 'previews' moved out of
+    the flat layout, 'files' of rows from before the blob store taken into it.
+    Each file is linked at its new path, the rows pointing at it are updated
+    and committed, and only then is the old name removed. A request that read
+    the old path just before that still finds the file through its blob, and
+    an interrupted run picks up where it stopped when started again.
+    """
+    from app import previews
+
+    folder = current_app.config['BLOB_FOLDER']
+    for batch in _batches(_flat_files(folder), batch_size):
+        known = set(db.session.scalars(select(Blob.sha256).where(Blob.sha256.in_([sha256 for sha256, _ in batch]))))
+        for sha256, _ in batch:
+            if sha256 in known:
+                _place(os.path.join(folder, sha256), path_for(sha256))
+                for model in REFERENCING_MODELS:
+                    db.session.execute(db.update(model).where(model.blob_sha256 == sha256).values(file_path=path_for(sha256)))
+        db.session.commit()
+        # Unknown names are blobs gc removed only from the sharded layout
+        for _, name in batch:
+            os.remove(os.path.join(folder, name))
+        yield 'blobs', len(batch)
+        time.sleep(pause)
+
+    folder = current_app.config['PREVIEW_FOLDER']
+    for batch in _batches(_flat_files(folder), batch_size):
+        known = set(db.session.scalars(select(Blob.sha256).where(Blob.sha256.in_([sha256 for sha256, _ in batch]))))
+        for sha256, name in batch:
+            if sha256 in known:
+                new_path = shard_path(folder, sha256, name)
+                _place(os.path.join(folder, name), new_path)
+                for model in previews.PREVIEW_MODELS:
+                    db.session.execute(db.update(model).where(
+                        model.blob_sha256 == sha256, model.preview_path == os.path.join(folder, name)
+                    ).values(preview_path=new_path))
+        db.session.commit()
+        for _, name in batch:
+            os.remove(os.path.join(folder, name))
+        yield 'previews', len(batch)
+        time.sleep(pause)
+
+    # Rows written before the blob store, or whose file the store's migration didn't find
+    for model in REFERENCING_MODELS:
+        last_id = 0
+        while True:
+            rows = model.query.filter(model.blob_sha256.is_(None), model.id > last_id).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            originals = set()
+            for row in rows:
+                if row.file_path and os.path.isfile(row.file_path):
+                    originals.add(row.file_path)
+                    blob = store_file(row.file_path)
+                    row.blob_sha256 = blob.sha256
+                    row.file_path = path_for(blob.sha256)
+            db.session.commit()
+            for path in originals:
+                if not _still_used(path):
+                    os.remove(path)
+            yield 'files', len(originals)
+            time.sleep(pause)
@@ -1,19 +1,30 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file
-from app import db
-from app.models import Ad, Brand, Edition, User
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort
+from app import db, blobs, downloads, previews
+from app.models import Ad, Brand, Edition, User, Task
 from app.blueprints.auth import login_required, get_current_user
+from app.blueprints.uploads import received_files
 from werkzeug.utils import secure_filename
-import os
 from datetime import datetime
 
 bp = Blueprint('ads', __name__, url_prefix='/ads')
 
-UPLOAD_FOLDER = 'app/static/uploads/ads'
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'psd', 'ai', 'eps'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def task_edition_ids(user):
+    """Editions the user has tasks assigned in, which lets them download that edition's ads."""
+    if user.role == 'manager':
+        return set()
+    return {edition_id for (edition_id,) in db.session.query(Task.edition_id).filter(
+        Task.assigned_to_id == user.id,
+        Task.edition_id.isnot(None)
+    ).distinct()}
+
+def can_download(user, ad, edition_ids):
+    return user.role == 'manager' or ad.uploaded_by_id == user.id or ad.edition_id in edition_ids
+
 @bp.route('/')
 @login_required
 def all_ads():
@@ -59,7 +70,9 @@ def all_ads():
     return render_template('ads/all_ads.html',
                          user=user,
                          brands=brands,
-                         ads_by_brand=ads_by_brand)
+                         ads_by_brand=ads_by_brand,
+                         edition_ids=task_edition_ids(user),
+                         can_download=can_download)
 
 @bp.route('/upload', methods=['GET', 'POST'])
 @login_required
@@ -73,16 +86,13 @@ def upload_ad():
         if edition_id == 'none':
             edition_id = None
         
-        if 'files' in request.files:
-            files = request.files.getlist('files')
+        files = received_files(allowed_file)
+        if files:
             for file in files:
                 if file and file.filename and allowed_file(file.filename):
                     filename = secure_filename(file.filename)
                     unique_filename = f"{brand_id}_{datetime.utcnow().timestamp()}_{filename}"
-                    filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
-                    
-                    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-                    file.save(filepath)
+                    blob = blobs.store(file)
                     
                     ad = Ad(
                         brand_id=brand_id,
@@ -90,8 +100,9 @@ def upload_ad():
                         uploaded_by_id=user.id,
                         filename=unique_filename,
                         original_filename=filename,
-                        file_path=filepath,
-                        file_type=filename.rsplit('.', 1)[1].lower()
+                        file_path=blobs.path_for(blob.sha256),
+                        file_type=filename.rsplit('.', 1)[1].lower(),
+                        blob_sha256=blob.sha256
                     )
                     db.session.add(ad)
         
@@ -113,26 +124,22 @@ def download_ad(ad_id):
     user = get_current_user()
     ad = Ad.query.get_or_404(ad_id)
     
-    is_authorized = False
-    
-    if user.role == 'manager':
-        is_authorized = True
-    elif ad.uploaded_by_id == user.id:
-        is_authorized = True
-    elif ad.edition_id:
-        from app.models import Task
-        user_tasks_in_edition = Task.query.filter(
-            Task.edition_id == ad.edition_id,
-            Task.assigned_to_id == user.id
-        ).first()
-        if user_tasks_in_edition:
-            is_authorized = True
-    
-    if not is_authorized:
+    if not can_download(user, ad, task_edition_ids(user)):
         flash('You do not have permission to download this ad.', 'danger')
         return redirect(url_for('ads.all_ads'))
     
-    return send_file(ad.file_path, as_attachment=True, download_name=ad.original_filename)
+    return downloads.send_upload(ad.file_path, ad.original_filename, ad.blob_sha256)
+
+@bp.route('/<int:ad_id>/preview')
+@login_required
+def ad_preview(ad_id):
+    user = get_current_user()
+    ad = Ad.query.get_or_404(ad_id)
+    
+    if not can_download(user, ad, task_edition_ids(user)):
+        abort(403)
+    
+    return previews.send(ad.preview_path, ad.blob_sha256)
 
 @bp.route('/<int:ad_id>/assign-edition', methods=['POST'])
 @login_required
@@ -1,5 +1,5 @@
 from flask import Blueprint, session, redirect, url_for, request, flash, render_template
-from app import db
+from app import db, identity
 from app.models import User
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
@@ -7,6 +7,11 @@ from functools import wraps
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+@bp.before_app_request
+def reset_identity():
+    # g lives as long as the app context, which can outlast one request
+    identity.forget_cached()
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -21,11 +26,11 @@ def role_required(*roles):
         def decorated_function(*args, **kwargs):
             if 'user_id' not in session:
                 return redirect(url_for('auth.login'))
-            user = User.query.get(session['user_id'])
-            if not user:
+            claims = identity.claims()
+            if not claims:
                 flash('User not found.', 'danger')
                 return redirect(url_for('auth.login'))
-            if user.role == 'super_admin' or user.role in roles:
+            if claims['role'] == 'super_admin' or claims['role'] in roles:
                 return f(*args, **kwargs)
             flash('You do not have permission to access this page.', 'danger')
             return redirect(url_for('main.dashboard'))
@@ -37,8 +42,8 @@ def super_admin_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             return redirect(url_for('auth.login'))
-        user = User.query.get(session['user_id'])
-        if not user or user.role != 'super_admin':
+        claims = identity.claims()
+        if not claims or claims['role'] != 'super_admin':
             flash('Super Admin access required.', 'danger')
             return redirect(url_for('main.dashboard'))
         return f(*args, **kwargs)
@@ -63,10 +68,7 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and check_password_hash(user.password, password):
-            session['user_id'] = user.id
-            session['username'] = user.username
-            session['role'] = user.role
-            session.permanent = True
+            identity.remember(user)
             flash(f'Welcome, {user.username}!', 'success')
             return redirect(get_role_based_redirect(user.role))
         else:
@@ -96,20 +98,15 @@ def callback():
         db.session.add(user)
         db.session.commit()
     
-    session['user_id'] = user.id
-    session['username'] = user.username
-    session['role'] = user.role
-    session.permanent = True
+    identity.remember(user)
     
     return redirect(url_for('main.dashboard'))
 
 @bp.route('/logout')
 def logout():
-    session.clear()
+    identity.forget()
     flash('You have been logged out.', 'info')
     return redirect(url_for('main.index'))
 
 def get_current_user():
-    if 'user_id' in session:
-        return User.query.get(session['user_id'])
-    return None
+    return identity.current_user()
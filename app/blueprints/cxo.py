@@ -1,18 +1,16 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, session, send_file
+from flask import Blueprint, render_template, request, flash, redirect, url_for, session
 from werkzeug.utils import secure_filename
-from app import db
-from app.models import CXOArticle, CXOArticleFile, Brand, Edition, User, Task, Notification
+from app import db, blobs, downloads, loaders, notifications, routing
+from app.models import CXOArticle, CXOArticleFile, Brand, Edition, User, Task
 from app.blueprints.auth import login_required, get_current_user, role_required, super_admin_required
+from app.blueprints.uploads import received_files
+from app.pagination import keyset_paginate
 from datetime import datetime
-import os
 
 bp = Blueprint('cxo', __name__, url_prefix='/cxo')
 
-UPLOAD_FOLDER = 'app/static/uploads/cxo_articles'
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'png', 'jpg', 'jpeg'}
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -26,7 +24,7 @@ def all_articles():
     edition_filter = request.args.get('edition', '')
     status_filter = request.args.get('status', '')
     
-    query = CXOArticle.query
+    query = CXOArticle.query.options(*loaders.ARTICLE_LIST)
     
     if user.role in ['cxo', 'sales']:
         query = query.filter_by(uploaded_by_id=user.id)
@@ -52,14 +50,17 @@ def all_articles():
         else:
             query = query.filter(CXOArticle.status == status_filter)
     
-    articles = query.order_by(CXOArticle.uploaded_at.desc()).all()
+    page = keyset_paginate(query, [(CXOArticle.uploaded_at, True), (CXOArticle.id, True)], per_page=50,
+                           after=request.args.get('after'),
+                           before=request.args.get('before'))
     brands = Brand.query.all()
     editions = Edition.query.all()
     statuses = ['Pending', 'Approved', 'Rejected', 'Designing', 'Design Ready', 'Used']
     
     return render_template('cxo/all_articles.html',
                          user=user,
-                         articles=articles,
+                         articles=page.items,
+                         page=page,
                          brands=brands,
                          editions=editions,
                          statuses=statuses)
@@ -97,10 +98,7 @@ def upload_article():
         if override_assign and assigned_to_id:
             assigned_editor = int(assigned_to_id)
         elif user.role == 'sales':
-            editorial_manager = User.query.filter_by(
-                department='editorial',
-                is_manager=True
-            ).first()
+            editorial_manager = routing.manager_for('editorial')
             if editorial_manager:
                 assigned_editor = editorial_manager.id
         
@@ -142,30 +140,29 @@ def upload_article():
         article.task_id = task.id
         
         if user.role == 'sales' and assigned_editor:
-            notification = Notification(
-                user_id=assigned_editor,
-                task_id=task.id,
-                message=f'New CXO Article uploaded by {user.username} for {company_name} - requires approval'
+            notifications.notify(
+                assigned_editor,
+                f'New CXO Article uploaded by {user.username} for {company_name} - requires approval',
+                task.id
             )
-            db.session.add(notification)
         
         uploaded_files = []
-        if 'files' in request.files:
-            files = request.files.getlist('files')
+        files = received_files(allowed_file)
+        if files:
             for file in files:
                 if file and file.filename and allowed_file(file.filename):
                     filename = secure_filename(file.filename)
                     timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
                     unique_filename = f"{article.id}_{timestamp}_{filename}"
-                    filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
-                    file.save(filepath)
+                    blob = blobs.store(file)
                     
                     article_file = CXOArticleFile(
                         article_id=article.id,
                         original_filename=filename,
                         stored_filename=unique_filename,
-                        file_path=filepath,
-                        file_type=filename.rsplit('.', 1)[1].lower() if '.' in filename else 'unknown'
+                        file_path=blobs.path_for(blob.sha256),
+                        file_type=filename.rsplit('.', 1)[1].lower() if '.' in filename else 'unknown',
+                        blob_sha256=blob.sha256
                     )
                     db.session.add(article_file)
                     uploaded_files.append(filename)
@@ -215,7 +212,7 @@ def download_file(file_id):
         flash('You do not have permission to download this file.', 'danger')
         return redirect(url_for('cxo.all_articles'))
     
-    return send_file(article_file.file_path, as_attachment=True, download_name=article_file.original_filename)
+    return downloads.send_upload(article_file.file_path, article_file.original_filename, article_file.blob_sha256)
 
 @bp.route('/article/<int:article_id>/approve', methods=['POST'])
 @login_required
@@ -255,12 +252,10 @@ def approve_article(article_id):
     
     article.comments = (article.comments or '') + approval_note
     
-    notification = Notification(
-        user_id=article.uploaded_by_id,
-        message=f'Your article for {article.company_name} has been approved by {user.username}!',
-        is_read=False
+    notifications.notify(
+        article.uploaded_by_id,
+        f'Your article for {article.company_name} has been approved by {user.username}!'
     )
-    db.session.add(notification)
     
     if create_design_task:
         description_text = f'Design task for approved CXO article #{article.id}'
@@ -285,15 +280,11 @@ def approve_article(article_id):
         article.task_id = task.id
         article.sync_with_task()
         
-        design_users = User.query.filter_by(role='design').all()
-        for design_user in design_users:
-            design_notification = Notification(
-                user_id=design_user.id,
-                message=f'New design task #{task.id} created for CXO article: {article.company_name}',
-                task_id=task.id,
-                is_read=False
-            )
-            db.session.add(design_notification)
+        notifications.notify_team(
+            'design',
+            f'New design task #{task.id} created for CXO article: {article.company_name}',
+            task.id
+        )
     
     db.session.commit()
     
@@ -329,12 +320,10 @@ def reject_article(article_id):
     rejection_note = f'{separator}[REJECTED by {user.username} on {datetime.utcnow().strftime("%Y-%m-%d %H:%M")}]: {reject_reason}'
     article.comments = (article.comments or '') + rejection_note
     
-    notification = Notification(
-        user_id=article.uploaded_by_id,
-        message=f'Your article for {article.company_name} was rejected by {user.username}. Reason: {reject_reason}',
-        is_read=False
+    notifications.notify(
+        article.uploaded_by_id,
+        f'Your article for {article.company_name} was rejected by {user.username}. Reason: {reject_reason}'
     )
-    db.session.add(notification)
     
     db.session.commit()
     
@@ -364,12 +353,10 @@ def mark_article_used(article_id):
     used_note = f'{separator}[MARKED AS USED by {user.username} on {datetime.utcnow().strftime("%Y-%m-%d %H:%M")}]'
     article.comments = (article.comments or '') + used_note
     
-    notification = Notification(
-        user_id=article.uploaded_by_id,
-        message=f'Your article for {article.company_name} has been marked as used in {article.edition.name if article.edition else "the magazine"}!',
-        is_read=False
+    notifications.notify(
+        article.uploaded_by_id,
+        f'Your article for {article.company_name} has been marked as used in {article.edition.name if article.edition else "the magazine"}!'
     )
-    db.session.add(notification)
     
     db.session.commit()
     
@@ -491,15 +478,11 @@ def edit_article(article_id):
             article.task_id = design_task.id
             article.sync_with_task()
             
-            design_users = User.query.filter_by(role='design').all()
-            for design_user in design_users:
-                design_notification = Notification(
-                    user_id=design_user.id,
-                    message=f'New design task #{design_task.id} created for edited CXO article: {article.company_name}',
-                    task_id=design_task.id,
-                    is_read=False
-                )
-                db.session.add(design_notification)
+            notifications.notify_team(
+                'design',
+                f'New design task #{design_task.id} created for edited CXO article: {article.company_name}',
+                design_task.id
+            )
         
         db.session.commit()
         
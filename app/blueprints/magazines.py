@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from app import db
+from app import db, loaders, stats
 from app.models import Brand, Edition, Task, CXOArticle
 from app.blueprints.auth import login_required, role_required, get_current_user
 from datetime import datetime
@@ -16,7 +16,18 @@ def all_magazines():
     status_filter = request.args.get('status', '')
     year_filter = request.args.get('year', '')
     
-    query = Edition.query
+    totals = stats.edition_totals()
+    
+    query = db.session.query(
+        Edition,
+        Brand,
+        db.func.coalesce(totals.c.task_count, 0),
+        db.func.coalesce(totals.c.completed_count, 0)
+    ).join(
+        Brand, Edition.brand_id == Brand.id
+    ).outerjoin(
+        totals, totals.c.edition_id == Edition.id
+    )
     
     if brand_filter:
         query = query.filter(Edition.brand_id == brand_filter)
@@ -28,24 +39,19 @@ def all_magazines():
         query = query.filter(Edition.year == int(year_filter))
     
     if search_query:
-        query = query.join(Brand).filter(
+        query = query.filter(
             (Edition.name.ilike(f'%{search_query}%')) |
             (Brand.name.ilike(f'%{search_query}%'))
         )
     
-    editions = query.order_by(Edition.created_at.desc()).all()
+    rows = query.order_by(Edition.created_at.desc()).all()
     
-    magazine_data = []
-    for edition in editions:
-        task_count = Task.query.filter_by(edition_id=edition.id).count()
-        completed_tasks = Task.query.filter_by(edition_id=edition.id, status='completed').count()
-        
-        magazine_data.append({
-            'brand': edition.brand,
-            'edition': edition,
-            'task_count': task_count,
-            'completed_tasks': completed_tasks
-        })
+    magazine_data = [{
+        'brand': brand,
+        'edition': edition,
+        'task_count': total,
+        'completed_tasks': completed
+    } for edition, brand, total, completed in rows]
     
     brands = Brand.query.all()
     statuses = ['Scheduled', 'Ongoing', 'Hold', 'Canceled', 'Completed', 'Online', 'Printed', 'Shipped']
@@ -116,7 +122,7 @@ def create_edition():
 def edition_detail(edition_id):
     user = get_current_user()
     edition = Edition.query.get_or_404(edition_id)
-    tasks = Task.query.filter_by(edition_id=edition_id).all()
+    tasks = Task.query.options(*loaders.TASK_LIST).filter_by(edition_id=edition_id).all()
     
     return render_template('magazines/edition_detail.html',
                          user=user,
@@ -147,18 +153,27 @@ def all_brands():
         flash('You do not have permission to view this page.', 'danger')
         return redirect(url_for('main.dashboard'))
     
-    brands = Brand.query.order_by(Brand.name).all()
-    
-    brand_data = []
-    for brand in brands:
-        edition_count = Edition.query.filter_by(brand_id=brand.id).count()
-        task_count = Task.query.filter_by(brand_id=brand.id).count()
-        
-        brand_data.append({
-            'brand': brand,
-            'edition_count': edition_count,
-            'task_count': task_count
-        })
+    edition_counts = db.session.query(
+        Edition.brand_id.label('brand_id'),
+        db.func.count(Edition.id).label('edition_count')
+    ).group_by(Edition.brand_id).subquery()
+    task_totals = stats.brand_totals()
+    
+    rows = db.session.query(
+        Brand,
+        db.func.coalesce(edition_counts.c.edition_count, 0),
+        db.func.coalesce(task_totals.c.task_count, 0)
+    ).outerjoin(
+        edition_counts, edition_counts.c.brand_id == Brand.id
+    ).outerjoin(
+        task_totals, task_totals.c.brand_id == Brand.id
+    ).order_by(Brand.name).all()
+    
+    brand_data = [{
+        'brand': brand,
+        'edition_count': edition_count,
+        'task_count': task_count
+    } for brand, edition_count, task_count in rows]
     
     return render_template('magazines/all_brands.html',
                          user=user,
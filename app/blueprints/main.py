@@ -1,11 +1,17 @@
-from flask import Blueprint, render_template, session, redirect, url_for
-from app import db
-from app.models import Task, Notification, User, CXOArticle
+from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify, Response
+from app import db, events, identity, loaders, notifications, routing
+from app.models import Task, User, CXOArticle
 from app.blueprints.auth import login_required, get_current_user, role_required
 from datetime import datetime, timedelta
 
 bp = Blueprint('main', __name__)
 
+# Task rows listed per table on the manager dashboard; the tiles count all of them
+MANAGER_DASHBOARD_ROWS = 50
+
+# Notification ids accepted by one POST /notifications/mark-read
+MAX_MARK_READ_IDS = 1000
+
 @bp.route('/')
 def index():
     if 'user_id' in session:
@@ -21,31 +27,28 @@ def dashboard():
         session.clear()
         return redirect(url_for('auth.login'))
     
-    todo_tasks = Task.query.filter_by(
+    todo_tasks = Task.query.options(*loaders.TASK_DASHBOARD).filter_by(
         assigned_to_id=user.id
     ).filter(
         Task.status.in_(['Assigned', 'InProgress', 'Review', 'Open'])
     ).order_by(Task.created_at.desc()).limit(5).all()
     
-    recent_tasks = Task.query.filter_by(
+    recent_tasks = Task.query.options(*loaders.TASK_DASHBOARD).filter_by(
         assigned_to_id=user.id
     ).order_by(Task.updated_at.desc()).limit(5).all()
     
-    upcoming_deadlines = Task.query.filter(
+    upcoming_deadlines = Task.query.options(*loaders.TASK_DASHBOARD).filter(
         Task.assigned_to_id == user.id,
         Task.deadline != None,
         Task.deadline >= datetime.utcnow(),
         Task.status.notin_(['Completed', 'Archived'])
     ).order_by(Task.deadline.asc()).limit(10).all()
     
-    notifications = Notification.query.filter_by(
-        user_id=user.id,
-        is_read=False
-    ).order_by(Notification.created_at.desc()).limit(5).all()
+    unread = notifications.unread_for(user, limit=5)
     
     pending_articles = []
     if user.role == 'editorial' or user.department == 'editorial':
-        pending_articles = CXOArticle.query.filter_by(
+        pending_articles = CXOArticle.query.options(*loaders.ARTICLE_LIST).filter_by(
             status='Pending',
             is_archived=False
         ).order_by(CXOArticle.uploaded_at.desc()).limit(5).all()
@@ -53,7 +56,7 @@ def dashboard():
     open_tasks = []
     design_team = []
     if user.department == 'design':
-        open_tasks = Task.query.filter_by(
+        open_tasks = Task.query.options(*loaders.TASK_DASHBOARD).filter_by(
             assigned_department='design',
             assigned_to_id=None,
             status='Open',
@@ -61,17 +64,14 @@ def dashboard():
         ).order_by(Task.created_at.desc()).all()
     
     if user.department == 'design' and user.is_manager:
-        design_team = User.query.filter_by(
-            department='design',
-            is_manager=False
-        ).all()
+        design_team = [member for member in routing.members('design') if not member.is_manager]
     
     return render_template('dashboard.html',
                          user=user,
                          todo_tasks=todo_tasks,
                          recent_tasks=recent_tasks,
                          upcoming_deadlines=upcoming_deadlines,
-                         notifications=notifications,
+                         notifications=unread,
                          pending_articles=pending_articles,
                          open_tasks=open_tasks,
                          design_team=design_team)
@@ -82,17 +82,17 @@ def dashboard():
 def cxo_dashboard():
     user = get_current_user()
     
-    my_articles = CXOArticle.query.filter_by(
+    my_articles = CXOArticle.query.options(*loaders.ARTICLE_LIST).filter_by(
         uploaded_by_id=user.id,
         is_archived=False
     ).order_by(CXOArticle.uploaded_at.desc()).all()
     
-    pending_articles = CXOArticle.query.filter_by(
+    pending_articles = CXOArticle.query.options(*loaders.ARTICLE_LIST).filter_by(
         status='Pending',
         is_archived=False
     ).order_by(CXOArticle.uploaded_at.desc()).limit(10).all()
     
-    approved_articles = CXOArticle.query.filter_by(
+    approved_articles = CXOArticle.query.options(*loaders.ARTICLE_LIST).filter_by(
         status='Approved',
         is_used=False,
         is_archived=False
@@ -107,9 +107,75 @@ def cxo_dashboard():
 @bp.route('/notifications/mark-read/<int:notification_id>', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id):
-    notification = Notification.query.get_or_404(notification_id)
-    if notification.user_id == session['user_id']:
-        notification.is_read = True
+    notifications.mark_read(get_current_user(), ids=[notification_id])
+    db.session.commit()
+    return '', 204
+
+def _marked_read(updated):
+    db.session.commit()
+    # Plain form posts from a page go back to it; API and fetch() callers get JSON
+    if request.accept_mimetypes.best == 'text/html':
+        return redirect(request.referrer or url_for('main.dashboard'))
+    unread, _ = notifications.unread_count(session['user_id'])
+    return jsonify(updated=updated, unread=unread)
+
+@bp.route('/notifications/mark-read/all', methods=['POST'])
+@login_required
+def mark_all_notifications_read():
+    return _marked_read(notifications.mark_read(get_current_user()))
+
+@bp.route('/notifications/mark-read/task/<int:task_id>', methods=['POST'])
+@login_required
+def mark_task_notifications_read(task_id):
+    return _marked_read(notifications.mark_read(get_current_user(), task_id=task_id))
+
+@bp.route('/notifications/mark-read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    raw_ids = (request.get_json(silent=True) or {}).get('ids', []) if request.is_json else request.form.getlist('ids')
+    try:
+        ids = [int(notification_id) for notification_id in raw_ids]
+    except (TypeError, ValueError):
+        return jsonify(error='Notification ids must be integers.'), 400
+    if len(ids) > MAX_MARK_READ_IDS:
+        return jsonify(error=f'At most {MAX_MARK_READ_IDS} notifications can be marked at once.'), 400
+    return _marked_read(notifications.mark_read(get_current_user(), ids=ids) if ids else 0)
+
+@bp.route('/notifications/unread-count')
+@login_required
+def unread_notification_count():
+    # Polled by the navbar badge: one primary-key lookup, and a 304 while nothing changed
+    count, version = notifications.unread_count(session['user_id'])
+    response = jsonify(unread=count)
+    response.set_etag(f"{session['user_id']}-{version}")
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@bp.route('/events/stream')
+@login_required
+def event_stream():
+    claims = identity.claims()
+    if not claims:
+        return '', 401
+    channels = [f"user:{session['user_id']}"]
+    if claims['department']:
+        channels.append(f"department:{claims['department']}")
+
+    stream = events.Stream.open(channels, request.headers.get('Last-Event-ID'))
+    if stream is None:
+        # Busy: the browser retries later and the badge keeps polling meanwhile
+        return '', 503, {'Retry-After': '30'}
+    response = Response(stream, mimetype='text/event-stream')
+    response.call_on_close(stream.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/notifications/broadcasts/mark-read/<int:broadcast_id>', methods=['POST'])
+@login_required
+def mark_broadcast_read(broadcast_id):
+    if notifications.mark_broadcast_read(get_current_user(), broadcast_id):
         db.session.commit()
     return '', 204
 
@@ -121,53 +187,78 @@ def manager_dashboard():
     if not user.is_manager:
         return redirect(url_for('main.dashboard'))
     
-    dept_tasks = Task.query.filter_by(
-        assigned_department=user.department,
-        is_archived=False
-    ).filter(
+    active = db.and_(
+        Task.is_archived == False,
         Task.status.notin_(['Completed', 'Archived'])
-    ).order_by(Task.created_at.desc()).all()
+    )
+    is_open = db.and_(Task.status == 'Open', Task.assigned_to_id.is_(None))
+    
+    def count_where(condition):
+        return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+    
+    totals = db.session.query(
+        db.func.count(Task.id),
+        count_where(is_open),
+        count_where(Task.assigned_to_id.isnot(None)),
+        count_where(Task.priority == 'high'),
+        count_where(Task.priority == 'urgent')
+    ).filter(
+        Task.assigned_department == user.department,
+        active
+    ).one()
+    
+    dept_tasks = Task.query.options(*loaders.TASK_LIST).filter(
+        Task.assigned_department == user.department,
+        active
+    ).order_by(Task.created_at.desc()).limit(MANAGER_DASHBOARD_ROWS).all()
+    
+    open_tasks = Task.query.options(*loaders.TASK_LIST).filter(
+        Task.assigned_department == user.department,
+        Task.is_archived == False,
+        is_open
+    ).order_by(Task.created_at.desc()).limit(MANAGER_DASHBOARD_ROWS).all()
     
     my_team = User.query.filter_by(
         department=user.department,
         is_manager=False
-    ).all()
-    
-    team_workload = []
-    for member in my_team:
-        active_tasks_count = Task.query.filter_by(
-            assigned_to_id=member.id
-        ).filter(
-            Task.status.notin_(['Completed', 'Archived']),
-            Task.is_archived == False
-        ).count()
-        
-        team_workload.append({
-            'user': member,
-            'active_tasks': active_tasks_count
-        })
-    
-    open_tasks = Task.query.filter_by(
-        assigned_department=user.department,
-        assigned_to_id=None,
-        status='Open',
-        is_archived=False
-    ).order_by(Task.created_at.desc()).all()
+    ).order_by(User.username).all()
+    
+    workload_rows = db.session.query(
+        Task.assigned_to_id, Task.priority, Task.status, db.func.count(Task.id)
+    ).join(
+        User, User.id == Task.assigned_to_id
+    ).filter(
+        User.department == user.department,
+        User.is_manager == False,
+        active
+    ).group_by(Task.assigned_to_id, Task.priority, Task.status).all()
+    
+    team_workload = {
+        member.id: {'user': member, 'active_tasks': 0, 'by_priority': {}, 'by_status': {}}
+        for member in my_team
+    }
+    for member_id, priority, status, count in workload_rows:
+        entry = team_workload[member_id]
+        entry['active_tasks'] += count
+        entry['by_priority'][priority] = entry['by_priority'].get(priority, 0) + count
+        entry['by_status'][status] = entry['by_status'].get(status, 0) + count
+    team_workload = list(team_workload.values())
     
     pending_articles = []
     if user.department == 'editorial':
-        pending_articles = CXOArticle.query.filter_by(
+        pending_articles = CXOArticle.query.options(*loaders.ARTICLE_LIST).filter_by(
             assigned_to_id=user.id,
             status='Pending',
             is_archived=False
         ).order_by(CXOArticle.uploaded_at.desc()).all()
     
+    total_tasks, open_count, assigned_count, high_count, urgent_count = totals
     stats = {
-        'total_department_tasks': len(dept_tasks),
-        'open_tasks': len(open_tasks),
-        'assigned_tasks': len([t for t in dept_tasks if t.assigned_to_id]),
-        'high_priority': len([t for t in dept_tasks if t.priority == 'high']),
-        'urgent_priority': len([t for t in dept_tasks if t.priority == 'urgent']),
+        'total_department_tasks': total_tasks,
+        'open_tasks': open_count,
+        'assigned_tasks': assigned_count,
+        'high_priority': high_count,
+        'urgent_priority': urgent_count,
         'team_members': len(my_team),
         'pending_articles': len(pending_articles)
     }
@@ -0,0 +1,278 @@
+from flask import Blueprint, request, session, jsonify, url_for, current_app, abort, flash
+from app import db, blobs
+from app.models import ChunkedUpload
+from app.blueprints.auth import login_required
+from werkzeug.utils import secure_filename
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime
+
+bp = Blueprint('uploads', __name__, url_prefix='/uploads')
+
+# Resumable uploads for files too big, or links too slow, for a single form post.
+#
+#   POST   /uploads                {filename, size, sha256?} -> upload state
+#   PUT    /uploads/<id>           one chunk, Content-Range: bytes start-end/size,
+#                                  optionally X-Chunk-SHA256 with the chunk's digest
+#   GET    /uploads/<id>           upload state, to resume after a failure
+#   POST   /uploads/<id>/complete  checks size and SHA-256 -> upload state
+#   DELETE /uploads/<id>
+#
+# Chunks are streamed straight to a part file at their offset and must arrive
+# in order. A completed upload is attached by posting its id as `upload_ids`
+# with the usual form (task files, new task, ads, CXO articles), which stores
+# it the same way as a file posted in the form itself. Each upload can be
+# attached once; one whose type the form doesn't accept is thrown away.
+
+# Bytes read from the request at a time while writing a chunk
+COPY_BUFFER_SIZE = 1024 * 1024
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+SHA256_HEX = re.compile(r'^[0-9a-f]{64}$')
+
+
+def fail(message, status, **extra):
+    return jsonify(dict(extra, error=message)), status
+
+
+def _part_path(upload_id):
+    return os.path.join(current_app.config['UPLOAD_INCOMING_FOLDER'], f'{upload_id}.part')
+
+
+def _load(upload_id):
+    upload = db.session.get(ChunkedUpload, upload_id)
+    if upload is None or upload.user_id != session['user_id']:
+        abort(404)
+    return upload
+
+
+def _state(upload):
+    return {
+        'id': upload.id,
+        'url': url_for('uploads.upload_status', upload_id=upload.id),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE'],
+        'sha256': upload.sha256 if upload.completed_at else None,
+        'complete': upload.completed_at is not None
+    }
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(COPY_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@bp.route('', methods=['POST'])
+@login_required
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    sha256 = (data.get('sha256') or '').lower() or None
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return fail('size is required.', 400)
+
+    if '.' not in filename:
+        return fail('A filename with an extension is required.', 400)
+    if size < 0:
+        return fail('Invalid size.', 400)
+    if size > current_app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+        return fail('File is too large.', 413)
+    if sha256 and not SHA256_HEX.match(sha256):
+        return fail('sha256 must be 64 hex digits.', 400)
+
+    upload = ChunkedUpload(id=uuid.uuid4().hex, user_id=session['user_id'], filename=filename, size=size, sha256=sha256)
+    os.makedirs(current_app.config['UPLOAD_INCOMING_FOLDER'], exist_ok=True)
+    open(_part_path(upload.id), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+
+    response = jsonify(_state(upload))
+    response.status_code = 201
+    response.headers['Location'] = url_for('uploads.upload_status', upload_id=upload.id)
+    return response
+
+
+@bp.route('/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    response = jsonify(_state(_load(upload_id)))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@bp.route('/<upload_id>', methods=['PUT'])
+@login_required
+def put_chunk(upload_id):
+    upload = _load(upload_id)
+    if upload.completed_at:
+        return fail('Upload is already complete.', 409, offset=upload.received)
+
+    match = CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+    if not match:
+        return fail('Content-Range: bytes start-end/size is required.', 400)
+    start, end, total = (int(value) for value in match.groups())
+    length = end - start + 1
+    if total != upload.size or end >= upload.size or length <= 0:
+        return fail('Content-Range does not fit this upload.', 416)
+    if request.content_length != length:
+        return fail('Content-Length must match Content-Range.', 400)
+    if start != upload.received:
+        return fail('Chunks must be sent in order.', 409, offset=upload.received)
+
+    path = _part_path(upload_id)
+    if not os.path.exists(path):
+        return fail('Upload has expired.', 410)
+    expected = (request.headers.get('X-Chunk-SHA256') or '').lower()
+
+    # Don't hold a database connection while the chunk trickles in over a slow link
+    db.session.rollback()
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as part:
+        part.seek(start)
+        while written < length:
+            block = request.stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            digest.update(block)
+            written += len(block)
+        # The offset recorded below must never point past bytes that could still be lost
+        part.flush()
+        os.fsync(part.fileno())
+
+    if written != length:
+        return fail('Chunk ended early.', 400, offset=start)
+    if expected and expected != digest.hexdigest():
+        return fail('Chunk checksum mismatch.', 422, offset=start)
+
+    # Only one request can move the offset on from where this chunk started
+    updated = db.session.execute(
+        db.update(ChunkedUpload).where(
+            ChunkedUpload.id == upload_id,
+            ChunkedUpload.received == start,
+            ChunkedUpload.completed_at.is_(None)
+        ).values(received=end + 1, updated_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not updated:
+        return fail('Chunk was overtaken by another request.', 409, offset=_load(upload_id).received)
+    return '', 204, {'Upload-Offset': str(end + 1)}
+
+
+@bp.route('/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    upload = _load(upload_id)
+    if upload.completed_at:
+        return jsonify(_state(upload))
+    if upload.received != upload.size:
+        return fail('Upload is not finished yet.', 409, offset=upload.received)
+
+    path = _part_path(upload_id)
+    size, expected = upload.size, upload.sha256
+    db.session.rollback()
+
+    # Drop anything a failed, over-long chunk left past the end
+    with open(path, 'r+b') as part:
+        part.truncate(size)
+    sha256 = _hash_file(path)
+    if expected and expected != sha256:
+        db.session.delete(_load(upload_id))
+        db.session.commit()
+        os.remove(path)
+        return fail('File checksum mismatch; upload it again.', 422)
+
+    db.session.execute(
+        db.update(ChunkedUpload).where(
+            ChunkedUpload.id == upload_id,
+            ChunkedUpload.completed_at.is_(None)
+        ).values(sha256=sha256, completed_at=datetime.utcnow(), updated_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return jsonify(_state(_load(upload_id)))
+
+
+@bp.route('/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(upload_id):
+    db.session.delete(_load(upload_id))
+    db.session.commit()
+    if os.path.exists(_part_path(upload_id)):
+        os.remove(_part_path(upload_id))
+    return '', 204
+
+
+class CompletedUpload:
+    """A finished chunked upload, standing in for a FileStorage in the upload forms."""
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.filename = upload.filename
+        # Already hashed on completion, so the blob store needn't read it again
+        self.sha256 = upload.sha256
+        self.size = upload.size
+        self.part_path = _part_path(upload.id)
+
+    def save(self, dst):
+        shutil.move(self.part_path, dst)
+        db.session.delete(self.upload)
+
+    def discard(self):
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+        db.session.delete(self.upload)
+
+
+def received_files(allowed):
+    """Files sent with the current form: multipart `files` plus completed uploads named in `upload_ids`.
+
+    A completed upload whose name fails ``allowed`` is discarded and reported
+    with a flash message. An id that names no finished upload of this user,
+    e.g. one a previous submission already attached, aborts the request.
+    """
+    files = [file for file in request.files.getlist('files') if file and file.filename]
+    upload_ids = list(dict.fromkeys(request.form.getlist('upload_ids')))
+    if upload_ids:
+        uploads = ChunkedUpload.query.filter(
+            ChunkedUpload.id.in_(upload_ids),
+            ChunkedUpload.user_id == session['user_id']
+        ).order_by(ChunkedUpload.created_at).all()
+        if len(uploads) != len(upload_ids):
+            abort(409, description='A file in this form was already attached or has expired; upload it again.')
+        for upload in uploads:
+            if upload.completed_at is None:
+                abort(409, description=f'{upload.filename} has not finished uploading.')
+            # A resubmitted form whose first attempt already moved the file into the store,
+            # but didn't commit, still finds it there; otherwise the file is gone
+            if not os.path.exists(_part_path(upload.id)) and not os.path.exists(blobs.path_for(upload.sha256)):
+                abort(409, description=f'{upload.filename} was already attached or has expired; upload it again.')
+            if not allowed(upload.filename):
+                CompletedUpload(upload).discard()
+                flash(f'{upload.filename} was not attached: that file type is not allowed.', 'danger')
+                continue
+            files.append(CompletedUpload(upload))
+    return files
+
+
+def prune(older_than):
+    """Remove uploads, finished or not, that nobody has touched since ``older_than``. Returns how many."""
+    stale = ChunkedUpload.query.filter(ChunkedUpload.updated_at < older_than).all()
+    for upload in stale:
+        db.session.delete(upload)
+    db.session.commit()
+    for upload in stale:
+        if os.path.exists(_part_path(upload.id)):
+            os.remove(_part_path(upload.id))
+    return len(stale)
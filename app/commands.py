@@ -0,0 +1,132 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app import db, blobs, notifications, previews, stats
+from app.models import Blob, CXOArticle
+from app.blueprints import uploads as chunked_uploads
+
+stats_cli = AppGroup('stats', help='Brand and edition task rollups.')
+
+@stats_cli.command('rebuild')
+def rebuild_stats():
+    """Recount brand_stats and edition_stats from the tasks table."""
+    brand_rows, edition_rows = stats.rebuild()
+    click.echo(f'Rebuilt brand_stats ({brand_rows} rows) and edition_stats ({edition_rows} rows).')
+
+articles_cli = AppGroup('articles', help='CXO article maintenance.')
+
+@articles_cli.command('sync')
+def sync_articles():
+    """Resync every task-linked CXO article's status and assignee in one UPDATE."""
+    updated = CXOArticle.sync_all_with_tasks()
+    db.session.commit()
+    click.echo(f'Synced {updated} CXO articles with their tasks.')
+
+notifications_cli = AppGroup('notifications', help='Notification maintenance.')
+
+@notifications_cli.command('recount')
+def recount_notifications():
+    """Recompute every user's unread notification counter."""
+    users = notifications.recount()
+    click.echo(f'Recounted unread notifications: {users} users with unread notifications.')
+
+@notifications_cli.command('prune')
+@click.option('--days', type=int, default=None, help='Age in days; defaults to NOTIFICATION_RETENTION_DAYS.')
+@click.option('--delete', 'delete_rows', is_flag=True, help='Delete instead of moving rows to notifications_archive.')
+@click.option('--batch-size', type=int, default=notifications.PRUNE_BATCH_SIZE, show_default=True)
+@click.option('--pause', type=float, default=0.0, show_default=True, help='Seconds to sleep between batches.')
+def prune_notifications(days, delete_rows, batch_size, pause):
+    """Archive or delete read notifications older than the retention period, in small batches."""
+    days = current_app.config['NOTIFICATION_RETENTION_DAYS'] if days is None else days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    action = 'Deleted' if delete_rows else 'Archived'
+
+    total = 0
+    started = time.perf_counter()
+    for count in notifications.prune(cutoff, archive=not delete_rows, batch_size=batch_size, pause=pause):
+        total += count
+        elapsed = time.perf_counter() - started
+        click.echo(f'  {total} rows, {total / elapsed:,.0f} rows/s')
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed else 0
+    click.echo(f'{action} {total} read notifications older than {days} days in {elapsed:.2f}s ({rate:,.0f} rows/s).')
+
+uploads_cli = AppGroup('uploads', help='Uploaded file maintenance.')
+
+@uploads_cli.command('prune')
+@click.option('--hours', type=int, default=None, help='Idle hours; defaults to CHUNKED_UPLOAD_EXPIRY_HOURS.')
+def prune_uploads(hours):
+    """Remove abandoned chunked uploads and their part files."""
+    hours = current_app.config['CHUNKED_UPLOAD_EXPIRY_HOURS'] if hours is None else hours
+    removed = chunked_uploads.prune(datetime.utcnow() - timedelta(hours=hours))
+    click.echo(f'Removed {removed} chunked uploads idle for more than {hours} hours.')
+
+blobs_cli = AppGroup('blobs', help='Content-addressed file store maintenance.')
+
+@blobs_cli.command('recount')
+def recount_blobs():
+    """Recompute every blob's reference count from the rows pointing at it."""
+    blobs.recount()
+    unreferenced = db.session.query(Blob).filter(Blob.ref_count <= 0).count()
+    click.echo(f'Recounted blob references: {unreferenced} blobs unreferenced.')
+
+@blobs_cli.command('shard')
+@click.option('--batch-size', type=int, default=blobs.SHARD_BATCH_SIZE, show_default=True)
+@click.option('--pause', type=float, default=0.0, show_default=True, help='Seconds to sleep between batches.')
+def shard_blobs(batch_size, pause):
+    """Move uploads stored flat into the sharded layout, in batches; safe to stop and run again."""
+    totals = Counter()
+    started = time.perf_counter()
+    for kind, count in blobs.shard(batch_size=batch_size, pause=pause):
+        totals[kind] += count
+        click.echo(f'  {kind}: {totals[kind]}')
+    elapsed = time.perf_counter() - started
+    click.echo(f'Moved {totals["blobs"]} blobs and {totals["previews"]} previews, and took {totals["files"]} '
+               f'older uploads into the blob store, in {elapsed:.2f}s.')
+
+@blobs_cli.command('gc')
+@click.option('--no-recount', is_flag=True, help='Trust the stored reference counts instead of recounting first.')
+def collect_blobs(no_recount):
+    """Delete blobs no task file, CXO article file or ad points at, and their files.
+
+    Also removes uploads from before the blob store once their content is in it.
+    """
+    if not no_recount:
+        blobs.recount()
+    removed, freed = blobs.collect_garbage()
+    click.echo(f'Removed {removed} unreferenced blobs, {freed / (1024 * 1024):,.1f} MB.')
+    removed, freed = blobs.remove_originals()
+    if removed:
+        click.echo(f'Removed {removed} uploads already in the blob store, {freed / (1024 * 1024):,.1f} MB.')
+
+previews_cli = AppGroup('previews', help='Ad and task file thumbnails.')
+
+@previews_cli.command('generate')
+@click.option('--workers', type=int, default=None, help='Render processes; defaults to the CPU count.')
+def generate_previews(workers):
+    """Make every missing preview: files uploaded before previews, or whose job was lost to a restart."""
+    jobs = previews.missing()
+    size = current_app.config['PREVIEW_SIZE']
+    made = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for sha256, file_type in jobs:
+            target = previews.path_for(sha256)
+            if os.path.exists(target):
+                previews.record(sha256, target)
+                made += 1
+            else:
+                futures[pool.submit(previews.render, blobs.stored_path(sha256), file_type, target, size)] = (sha256, target)
+        for future in as_completed(futures):
+            if future.result():
+                previews.record(*futures[future])
+                made += 1
+    elapsed = time.perf_counter() - started
+    click.echo(f'Made {made} of {len(jobs)} missing previews in {elapsed:.2f}s.')
+
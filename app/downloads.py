@@ -0,0 +1,61 @@
+import os
+from urllib.parse import quote
+from flask import abort, current_app, request, send_file
+from werkzeug.utils import send_file as send_file_response
+from app import blobs
+
+# Sends stored uploads once a view has checked the user may have them. Blob
+# rows get their SHA-256 as a strong ETag, so revalidating a cached copy or
+# resuming an interrupted download (If-Range) always compares content.
+#
+# DOWNLOAD_OFFLOAD hands the transfer to the web server in front of the app:
+# 'x-accel' for nginx (X-Accel-Redirect to DOWNLOAD_ACCEL_PREFIX, an internal
+# location aliasing UPLOAD_FOLDER) or 'x-sendfile' for Apache mod_xsendfile
+# and lighttpd. Flask then only answers If-None-Match itself; the server
+# sends the bytes and serves Range requests.
+
+
+def _accel_uri(path):
+    relative = os.path.relpath(path, os.path.abspath(current_app.config['UPLOAD_FOLDER']))
+    if relative == os.curdir or relative.startswith(os.pardir + os.sep):
+        return None
+    prefix = current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/')
+    return f"{prefix}/{quote(relative.replace(os.sep, '/'))}"
+
+
+def send_upload(file_path, download_name, sha256=None):
+    """Send a stored file as an attachment named ``download_name``.
+
+    ``sha256`` is the blob the row points at, if any; rows without one get
+    werkzeug's mtime/size ETag instead.
+    """
+    path = os.path.abspath(file_path)
+    if not os.path.isfile(path) and sha256:
+        # Moved by `flask blobs shard` since the row was read
+        path = os.path.abspath(blobs.stored_path(sha256))
+    if not os.path.isfile(path):
+        abort(404)
+
+    mode = current_app.config['DOWNLOAD_OFFLOAD']
+    accel_uri = _accel_uri(path) if mode == 'x-accel' else None
+    if mode == 'x-sendfile' or accel_uri:
+        response = send_file_response(
+            path, request.environ, as_attachment=True, download_name=download_name,
+            etag=sha256 or True, use_x_sendfile=True, conditional=False,
+            response_class=current_app.response_class
+        )
+        # Not accepting ranges here leaves Range to the web server, which has the bytes
+        response = response.make_conditional(request.environ)
+        if response.status_code != 200:
+            response.headers.pop('X-Sendfile', None)
+        elif accel_uri:
+            del response.headers['X-Sendfile']
+            response.headers['X-Accel-Redirect'] = accel_uri
+        response.headers['Accept-Ranges'] = 'bytes'
+    else:
+        # Answers If-None-Match, Range and If-Range, streaming only the part asked for
+        response = send_file(path, as_attachment=True, download_name=download_name, etag=sha256 or True)
+
+    # Behind a login: browsers may keep it, shared caches may not
+    response.cache_control.private = True
+    return response
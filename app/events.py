@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import deque
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Task
+
+# Live events for the SSE stream (/events/stream). Code emits (channels, name,
+# data) while it writes; subscribers only ever see events of committed
+# transactions, once each however many of their channels an event is on.
+# Channels are 'user:<id>' and 'department:<name>'.
+
+logger = logging.getLogger(__name__)
+
+# Events kept per process so a reconnecting stream can resume from Last-Event-ID
+BACKLOG_SIZE = 512
+
+# Reconnect delay sent to EventSource clients
+RETRY_MILLISECONDS = 3000
+
+
+class InProcessBus:
+    """Delivers events to streams served by this process only."""
+
+    # Events are handed over after commit rather than sent inside the transaction
+    transactional = False
+
+    def __init__(self, backlog=BACKLOG_SIZE):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=backlog)
+        self._sequence = 0
+        # Event ids only mean something to the process that issued them
+        self._prefix = f'{os.getpid()}.{int(time.time())}'
+
+    def dispatch(self, events):
+        with self._condition:
+            for channels, name, data in events:
+                self._sequence += 1
+                self._events.append((self._sequence, frozenset(channels), name, data))
+            self._condition.notify_all()
+
+    def cursor(self, last_event_id=None):
+        """Where a new subscriber starts reading: just after last_event_id if we issued it, else now."""
+        with self._condition:
+            prefix, _, sequence = (last_event_id or '').rpartition('-')
+            if prefix == self._prefix and sequence.isdigit():
+                return int(sequence)
+            return self._sequence
+
+    def wait(self, cursor, channels, timeout):
+        """Block up to ``timeout`` seconds for events after ``cursor`` on ``channels``.
+
+        Returns (new cursor, [(event id, name, data)], missed). ``missed`` is
+        True when events after the cursor already fell out of the backlog.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                missed = bool(self._events) and self._events[0][0] > cursor + 1
+                found = [
+                    (f'{self._prefix}-{sequence}', name, data)
+                    for sequence, targets, name, data in self._events
+                    if sequence > cursor and not targets.isdisjoint(channels)
+                ]
+                remaining = deadline - time.monotonic()
+                if found or missed or remaining <= 0:
+                    return self._sequence, found, missed
+                self._condition.wait(remaining)
+
+
+class PostgresBus(InProcessBus):
+    """Fans events out to every worker with LISTEN/NOTIFY.
+
+    NOTIFY is sent on the writing transaction's connection, so Postgres only
+    delivers it on commit. Each process runs one listener thread on its own
+    connection and hands what it hears to its streams.
+    """
+
+    transactional = True
+    CHANNEL = 'app_events'
+
+    def __init__(self, engine, backlog=BACKLOG_SIZE):
+        super().__init__(backlog)
+        self._engine = engine
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def send(self, connection, events):
+        payloads = [json.dumps({'channels': list(channels), 'name': name, 'data': data}) for channels, name, data in events]
+        connection.execute(
+            text('SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload'),
+            {'channel': self.CHANNEL, 'payloads': payloads}
+        )
+
+    def wait(self, cursor, channels, timeout):
+        self._start_listener()
+        return super().wait(cursor, channels, timeout)
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='event-bus-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                # Detached from the pool: this connection sits in LISTEN for the life of the process
+                raw = self._engine.raw_connection()
+                raw.detach()
+                connection = raw.driver_connection
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {self.CHANNEL}')
+                while True:
+                    if select.select([connection], [], [], 30) == ([], [], []):
+                        continue
+                    connection.poll()
+                    events = []
+                    while connection.notifies:
+                        payload = json.loads(connection.notifies.pop(0).payload)
+                        events.append((payload['channels'], payload['name'], payload['data']))
+                    if events:
+                        self.dispatch(events)
+            except Exception:
+                logger.exception('Event bus listener failed; reconnecting')
+                time.sleep(5)
+
+
+class Stream:
+    """One client's SSE connection. Holds a per-process slot until closed."""
+
+    _open = 0
+    _lock = threading.Lock()
+
+    def __init__(self, target, channels, last_event_id, keepalive, lifetime):
+        self._target = target
+        self._channels = set(channels)
+        self._cursor = target.cursor(last_event_id)
+        self._keepalive = keepalive
+        self._lifetime = lifetime
+        self._closed = False
+
+    @classmethod
+    def open(cls, channels, last_event_id=None):
+        """A Stream for ``channels``, or None if this process already serves SSE_MAX_STREAMS."""
+        config = current_app.config
+        with cls._lock:
+            if cls._open >= config['SSE_MAX_STREAMS']:
+                return None
+            cls._open += 1
+        return cls(
+            current_app.extensions['event_bus'], channels, last_event_id,
+            config['SSE_KEEPALIVE_SECONDS'], config['SSE_STREAM_SECONDS']
+        )
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                Stream._open -= 1
+
+    def __iter__(self):
+        # Runs after the request context is gone: no app, session or database access here
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        deadline = time.monotonic() + self._lifetime
+        while not self._closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Ending the response hands the worker back; EventSource reconnects with Last-Event-ID
+                return
+            self._cursor, found, missed = self._target.wait(self._cursor, self._channels, min(self._keepalive, remaining))
+            if missed:
+                yield 'event: resync\ndata: {}\n\n'
+            for event_id, name, data in found:
+                yield f'id: {event_id}\nevent: {name}\ndata: {json.dumps(data)}\n\n'
+            if not found and not missed:
+                # Also how a dropped client is noticed: the write fails and the server closes us
+                yield ': keepalive\n\n'
+
+
+def init_app(app):
+    with app.app_context():
+        # Decided by the engine, not DATABASE_URL: configs such as check_query_budget.py's run on SQLite
+        if app.config['EVENT_BUS'] in ('', 'postgres') and db.engine.dialect.name == 'postgresql':
+            app.extensions['event_bus'] = PostgresBus(db.engine)
+        else:
+            app.extensions['event_bus'] = InProcessBus()
+
+
+def emit(channels, name, data):
+    """Publish an event to one channel or a list of them once the current transaction commits."""
+    if isinstance(channels, str):
+        channels = [channels]
+    db.session.info.setdefault('pending_events', []).append((sorted(set(channels)), name, data))
+
+
+def task_changed(task, assigned_to_id=None, department=None):
+    """Tell the task's assignee and department, old and new, that it changed."""
+    data = {
+        'id': task.id,
+        'status': task.status,
+        'department': task.current_department,
+        'assigned_to_id': task.assigned_to_id
+    }
+    channels = [f'user:{user_id}' for user_id in (task.assigned_to_id, assigned_to_id) if user_id]
+    channels += [f'department:{name}' for name in (task.current_department, department) if name]
+    emit(channels, 'task', data)
+
+
+def _previous(state, name):
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else None
+
+
+@event.listens_for(Session, 'after_flush')
+def _emit_task_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Task):
+            continue
+        state = inspect(obj)
+        if obj in session.new or any(
+            state.attrs[name].history.has_changes()
+            for name in ('status', 'current_department', 'assigned_to_id')
+        ):
+            task_changed(obj, _previous(state, 'assigned_to_id'), _previous(state, 'current_department'))
+
+
+def _current_bus():
+    if has_app_context():
+        return current_app.extensions.get('event_bus')
+    return None
+
+
+# A transactional bus gets the events inside the transaction, once the flush
+# hooks that emit them have all run; the database holds them until commit.
+@event.listens_for(Session, 'after_flush_postexec')
+def _send_flushed_events(session, flush_context):
+    _send_events(session)
+
+
+@event.listens_for(Session, 'before_commit')
+def _send_events(session):
+    target = _current_bus()
+    if target is not None and target.transactional and session.info.get('pending_events'):
+        target.send(session.connection(), session.info.pop('pending_events'))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_events(session):
+    events = session.info.pop('pending_events', None)
+    target = _current_bus()
+    if events and target is not None and not target.transactional:
+        target.dispatch(events)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_events(session, previous_transaction):
+    session.info.pop('pending_events', None)
@@ -0,0 +1,127 @@
+import time
+from flask import current_app, g, has_app_context, session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app import db, upserts
+from app.models import CacheVersion, User
+
+# User attributes copied into the signed session cookie so authorization
+# checks can be answered without touching the users table
+CLAIM_ATTRIBUTES = ('role', 'department', 'is_manager')
+
+# Claims record the user's shared 'auth:<user_id>' stamp in cache_versions
+# they were issued under. Changing any of the attributes above bumps the stamp
+# in the same transaction, so once it commits every process stops trusting
+# older claims. The stamp is read at most once per request.
+STAMP = 'auth'
+
+
+def _stamp_name(user_id):
+    return f'{STAMP}:{user_id}'
+
+
+def _current_stamp(user_id):
+    stamps = g.setdefault('auth_stamps', {})
+    if user_id not in stamps:
+        stamps[user_id] = db.session.execute(
+            select(CacheVersion.version).where(CacheVersion.name == _stamp_name(user_id))
+        ).scalar() or 0
+    return stamps[user_id]
+
+
+def _claims_for(user):
+    data = {name: getattr(user, name) for name in CLAIM_ATTRIBUTES}
+    data['version'] = user.auth_version
+    return data
+
+
+def remember(user):
+    """Log the user in for this session and issue fresh claims."""
+    session['user_id'] = user.id
+    session['username'] = user.username
+    session['role'] = user.role
+    session['claims'] = dict(_claims_for(user), stamp=_current_stamp(user.id), issued_at=int(time.time()))
+    session.permanent = True
+    g.current_user = user
+
+
+def forget():
+    session.clear()
+    forget_cached()
+
+
+def forget_cached():
+    g.pop('current_user', None)
+    g.pop('auth_stamps', None)
+
+
+def current_user():
+    """The logged-in User, loaded at most once per request."""
+    if 'user_id' not in session:
+        return None
+    if 'current_user' not in g:
+        user = db.session.get(User, session['user_id'])
+        g.current_user = user
+        if user is not None:
+            data = session.get('claims') or {}
+            if {key: data.get(key) for key in CLAIM_ATTRIBUTES + ('version',)} != _claims_for(user):
+                remember(user)
+    return g.current_user
+
+
+def _fresh(data):
+    if not data:
+        return False
+    if data.get('stamp') != _current_stamp(session['user_id']):
+        return False
+    return time.time() - data.get('issued_at', 0) < current_app.config['AUTH_CLAIMS_MAX_AGE']
+
+
+def claims():
+    """Role, department and manager flag of the logged-in user, or None.
+
+    Served from the session while fresh; otherwise the user is reloaded and
+    the claims reissued.
+    """
+    if 'user_id' not in session:
+        return None
+    if not _fresh(session.get('claims')):
+        user = current_user()
+        if user is None:
+            return None
+        remember(user)
+    return session['claims']
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_auth_version(session, flush_context, instances):
+    for obj in session.dirty:
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[name].history.has_changes() for name in CLAIM_ATTRIBUTES):
+            obj.auth_version = (obj.auth_version or 0) + 1
+            session.info.setdefault('auth_dirty', set()).add(obj.id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_auth_stamps(session, flush_context):
+    for user_id in session.info.pop('auth_dirty', ()):
+        row = {'name': _stamp_name(user_id), 'version': 1}
+        upserts.add(session.connection(), CacheVersion.__table__, ['name'], [row], ['version'])
+        session.info['auth_changed'] = True
+    if session.info.get('auth_changed') and has_app_context():
+        g.pop('auth_stamps', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_auth_stamps(session):
+    session.info.pop('auth_changed', None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_auth_stamps(session, previous_transaction):
+    session.info.pop('auth_dirty', None)
+    # Stamps read inside the rolled back transaction may have been its own
+    if session.info.pop('auth_changed', False) and has_app_context():
+        g.pop('auth_stamps', None)
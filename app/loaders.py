@@ -0,0 +1,49 @@
+from sqlalchemy.orm import configure_mappers, joinedload
+from app.models import Task, Edition, CXOArticle, TaskHistory, TaskFile
+
+# Relationship loader profiles for list views. Apply with query.options(*PROFILE)
+# so a page costs the same number of queries whatever its row count.
+#
+# Everything a list row touches is many-to-one, so it rides along in the list
+# query itself as a LEFT OUTER JOIN rather than costing extra round trips.
+# Collections, if a profile ever needs one, should use selectinload instead.
+
+# Backref attributes (Task.assigned_user, Task.creator, Edition.brand) only
+# exist once the mappers are configured.
+configure_mappers()
+
+TASK_LIST = (
+    joinedload(Task.brand),
+    joinedload(Task.edition).joinedload(Edition.brand),
+    joinedload(Task.assigned_user),
+    joinedload(Task.creator),
+)
+
+# Everything a workflow transition's guards and effects read (app/workflow.py)
+TASK_WORKFLOW = (
+    joinedload(Task.cxo_article),
+    joinedload(Task.assigned_user),
+    joinedload(Task.creator),
+    joinedload(Task.original_requester),
+    joinedload(Task.editorial_owner),
+    joinedload(Task.design_owner),
+)
+
+TASK_DASHBOARD = TASK_LIST + (
+    joinedload(Task.original_requester),
+)
+
+ARTICLE_LIST = (
+    joinedload(CXOArticle.brand),
+    joinedload(CXOArticle.edition),
+    joinedload(CXOArticle.uploaded_by),
+    joinedload(CXOArticle.assigned_to),
+)
+
+HISTORY_LIST = (
+    joinedload(TaskHistory.user),
+)
+
+TASK_FILE_LIST = (
+    joinedload(TaskFile.uploaded_by),
+)
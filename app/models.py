@@ -12,6 +12,8 @@ class User(db.Model):
     role = db.Column(db.String(50), nullable=False, default='sales')
     department = db.Column(db.String(50))
     is_manager = db.Column(db.Boolean, default=False)
+    # Bumped whenever role, department or is_manager change; see app/identity.py
+    auth_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     assigned_tasks = db.relationship('Task', foreign_keys='Task.assigned_to_id', backref='assigned_user', lazy='dynamic')
@@ -44,7 +46,23 @@ class Edition(db.Model):
 
 class Task(db.Model):
     __tablename__ = 'tasks'
-    
+    __table_args__ = (
+        # my_tasks, dashboard to-do/deadline lists and per-member workload counts
+        db.Index('ix_tasks_assigned_to_status', 'assigned_to_id', 'status'),
+        # manager dashboard and department queues only ever look at live tasks
+        db.Index('ix_tasks_dept_assignee_status_live', 'assigned_department', 'assigned_to_id', 'status',
+                 postgresql_where=db.text('is_archived = false'),
+                 sqlite_where=db.text('is_archived = 0')),
+        db.Index('ix_tasks_current_dept_status', 'current_department', 'status'),
+        # open pool: the pickup queues never need assigned rows
+        db.Index('ix_tasks_open_pool', 'current_department', 'created_at',
+                 postgresql_where=db.text("status = 'Open' AND assigned_to_id IS NULL"),
+                 sqlite_where=db.text("status = 'Open' AND assigned_to_id IS NULL")),
+        db.Index('ix_tasks_edition_status', 'edition_id', 'status'),
+        db.Index('ix_tasks_brand_id', 'brand_id'),
+        db.Index('ix_tasks_created_at_id', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     brand_id = db.Column(db.Integer, db.ForeignKey('brands.id'), nullable=True)
     edition_id = db.Column(db.Integer, db.ForeignKey('editions.id'), nullable=True)
@@ -73,6 +91,10 @@ class Task(db.Model):
     completed_at = db.Column(db.DateTime)
     archived_at = db.Column(db.DateTime)
     is_archived = db.Column(db.Boolean, default=False)
+    # Bumped by every write; an UPDATE only applies to the version it read (optimistic locking)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    __mapper_args__ = {'version_id_col': version}
     
     brand = db.relationship('Brand', backref='tasks')
     original_requester = db.relationship('User', foreign_keys=[original_requester_id], backref='requested_tasks')
@@ -81,6 +103,22 @@ class Task(db.Model):
     files = db.relationship('TaskFile', backref='task', lazy='dynamic', cascade='all, delete-orphan')
     history = db.relationship('TaskHistory', backref='task', lazy='dynamic', cascade='all, delete-orphan', order_by='TaskHistory.created_at.desc()')
 
+class BrandStats(db.Model):
+    __tablename__ = 'brand_stats'
+    
+    brand_id = db.Column(db.Integer, db.ForeignKey('brands.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    department = db.Column(db.String(50), primary_key=True)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
+
+class EditionStats(db.Model):
+    __tablename__ = 'edition_stats'
+    
+    edition_id = db.Column(db.Integer, db.ForeignKey('editions.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    department = db.Column(db.String(50), primary_key=True)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
+
 class TaskFile(db.Model):
     __tablename__ = 'task_files'
     
@@ -95,6 +133,10 @@ class TaskFile(db.Model):
     file_type = db.Column(db.String(50))
     file_size = db.Column(db.Integer)
     version = db.Column(db.Integer, default=1)
+    # Content in the blob store (app/blobs.py); file_path is where it lives
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), nullable=True, index=True)
+    # Thumbnail or first-page preview, once app/previews.py has made one
+    preview_path = db.Column(db.String(500))
     
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     deleted_at = db.Column(db.DateTime, nullable=True)
@@ -133,6 +175,10 @@ class Ad(db.Model):
     original_filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_type = db.Column(db.String(50))
+    # Content in the blob store (app/blobs.py); file_path is where it lives
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), nullable=True, index=True)
+    # Thumbnail or first-page preview, once app/previews.py has made one
+    preview_path = db.Column(db.String(500))
     
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -141,6 +187,16 @@ class Ad(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        # dashboard unread list; read notifications are never looked up by user
+        db.Index('ix_notifications_user_unread', 'user_id', 'created_at',
+                 postgresql_where=db.text('is_read = false'),
+                 sqlite_where=db.text('is_read = 0')),
+        # retention job: oldest read notifications first
+        db.Index('ix_notifications_read_created_at', 'created_at',
+                 postgresql_where=db.text('is_read = true'),
+                 sqlite_where=db.text('is_read = 1')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -148,12 +204,70 @@ class Notification(db.Model):
     
     message = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
+    # Alerts folded into this row by coalescing; created_at is that of the latest
+    repeat_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     task = db.relationship('Task', backref='notifications')
 
+class NotificationArchive(db.Model):
+    """Read notifications moved out of the live table by `flask notifications prune`."""
+    __tablename__ = 'notifications_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    task_id = db.Column(db.Integer, nullable=True)
+
+    message = db.Column(db.Text, nullable=False)
+    repeat_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class NotificationBroadcast(db.Model):
+    """One notification for a whole team; members' reads are NotificationReceipts."""
+    __tablename__ = 'notification_broadcasts'
+    __table_args__ = (
+        db.Index('ix_notification_broadcasts_team_created_at', 'team', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    team = db.Column(db.String(50), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=True)
+
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    task = db.relationship('Task')
+
+class NotificationReceipt(db.Model):
+    __tablename__ = 'notification_receipts'
+
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('notification_broadcasts.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    read_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class NotificationCounter(db.Model):
+    """Unread notifications per user, kept in step by app/notifications.py."""
+    __tablename__ = 'notification_counters'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped on every change; clients revalidate the unread badge against it
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class CacheVersion(db.Model):
+    """Named counters shared by all workers, e.g. the routing directory stamp (app/routing.py) and role claim stamps (app/identity.py)."""
+    __tablename__ = 'cache_versions'
+
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
 class CXOArticle(db.Model):
     __tablename__ = 'cxo_articles'
+    __table_args__ = (
+        # Task.cxo_article lookups from every workflow action
+        db.Index('ix_cxo_articles_task_id', 'task_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     brand_id = db.Column(db.Integer, db.ForeignKey('brands.id'), nullable=False)
@@ -182,7 +296,7 @@ class CXOArticle(db.Model):
     edition = db.relationship('Edition', backref='cxo_articles')
     uploaded_by = db.relationship('User', foreign_keys=[uploaded_by_id], backref='uploaded_articles')
     assigned_to = db.relationship('User', foreign_keys=[assigned_to_id], backref='assigned_articles')
-    task = db.relationship('Task', backref='cxo_article', foreign_keys=[task_id])
+    task = db.relationship('Task', backref=db.backref('cxo_article', uselist=False), foreign_keys=[task_id])
     files = db.relationship('CXOArticleFile', backref='article', lazy=True, cascade='all, delete-orphan')
     
     def sync_with_task(self):
@@ -209,6 +323,32 @@ class CXOArticle(db.Model):
                 self.status = 'Pending'
         
         self.updated_at = datetime.utcnow()
+    
+    @classmethod
+    def sync_all_with_tasks(cls, task_ids=None):
+        """Set-based sync_with_task() for every linked article, or those of task_ids.
+
+        Runs as a single UPDATE ... FROM tasks and returns the number of
+        articles updated. Does not touch articles already in the session.
+        """
+        status = db.case(
+            (cls.is_used == True, 'Used'),
+            (cls.status == 'Rejected', cls.status),
+            (db.and_(Task.current_department == 'design', Task.status == 'Completed'), 'Design Ready'),
+            (db.and_(Task.current_department == 'design', Task.assigned_to_id.isnot(None)), 'Designing'),
+            (Task.current_department == 'design', 'Awaiting Design'),
+            (db.and_(Task.current_department == 'editorial', Task.status == 'Completed'), 'Approved'),
+            (Task.current_department == 'editorial', 'Pending'),
+            else_=cls.status
+        )
+        stmt = db.update(cls).where(cls.task_id == Task.id).values(
+            assigned_to_id=Task.assigned_to_id,
+            status=status,
+            updated_at=datetime.utcnow()
+        )
+        if task_ids is not None:
+            stmt = stmt.where(cls.task_id.in_(task_ids))
+        return db.session.execute(stmt.execution_options(synchronize_session=False)).rowcount
 
 class CXOArticleFile(db.Model):
     __tablename__ = 'cxo_article_files'
@@ -219,4 +359,32 @@ class CXOArticleFile(db.Model):
     stored_filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_type = db.Column(db.String(50))
+    # Content in the blob store (app/blobs.py); file_path is where it lives
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), nullable=True, index=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChunkedUpload(db.Model):
+    """A resumable upload being sent in chunks; see app/blueprints/uploads.py."""
+    __tablename__ = 'chunked_uploads'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    # Bytes on disk so far; the next chunk is only accepted at this offset
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    # Whole-file SHA-256: as declared by the client, then as computed on completion
+    sha256 = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+class Blob(db.Model):
+    """Uploaded file content, stored once per SHA-256 whichever rows carry it; see app/blobs.py."""
+    __tablename__ = 'blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    # Task files, CXO article files and ads pointing here; at 0 `flask blobs gc` may remove it
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,408 @@
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import bindparam, event, exists, func, inspect, literal, or_, text
+from sqlalchemy.orm import Session, joinedload
+from app import db, events, upserts
+from app.models import Notification, NotificationArchive, NotificationBroadcast, NotificationReceipt, NotificationCounter, User
+
+# Rows per multi-row INSERT in notify_many()
+INSERT_BATCH_SIZE = 500
+
+# Rows moved or deleted per transaction by prune(); small enough that each
+# batch's locks are held only briefly while the app is serving requests
+PRUNE_BATCH_SIZE = 1000
+
+# Team notifications go either to one row per member ('rows') or to a single
+# broadcast row with read receipts created as members read it ('broadcast').
+# Team membership follows the role, as the routing permission checks do.
+TEAM_MODES = ('rows', 'broadcast')
+
+
+def _coalescing_since(now):
+    """Unread notifications about the same task newer than this absorb new ones; None when disabled."""
+    seconds = current_app.config['NOTIFICATION_COALESCE_SECONDS']
+    return now - timedelta(seconds=seconds) if seconds > 0 else None
+
+
+def _open_for(task_id, since):
+    return [Notification.task_id == task_id, Notification.is_read == False, Notification.created_at >= since]
+
+
+def _notifications_changed(user_ids):
+    # Coalesced rows leave unread counts alone but still change what the user sees
+    for user_id in sorted(set(user_ids)):
+        events.emit(f'user:{user_id}', 'notifications', {'change': 0})
+
+
+def notify(user_id, message, task_id=None):
+    """Queue one notification for a user in the current session.
+
+    Within the coalescing window a repeat about the same task updates the
+    user's newest unread one instead, and None is returned.
+    """
+    now = datetime.utcnow()
+    since = _coalescing_since(now) if task_id is not None else None
+    if since is not None:
+        newest = db.select(Notification.id).where(
+            Notification.user_id == user_id, *_open_for(task_id, since)
+        ).order_by(Notification.created_at.desc(), Notification.id.desc()).limit(1).scalar_subquery()
+        coalesced = db.session.execute(
+            db.update(Notification).where(Notification.id == newest).values(
+                message=message, created_at=now, repeat_count=Notification.repeat_count + 1
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        if coalesced:
+            _notifications_changed([user_id])
+            return None
+
+    notification = Notification(user_id=user_id, task_id=task_id, message=message, is_read=False, created_at=now)
+    db.session.add(notification)
+    return notification
+
+
+def notify_many(rows):
+    """Write ``{'user_id', 'message', 'task_id', 'created_at'}`` dicts set-based.
+
+    Rows coalesce like notify(): repeats for a (user, task) with an open
+    notification update it in one executemany UPDATE, the rest go in
+    multi-row INSERTs. Returns the number of rows inserted.
+    """
+    now = datetime.utcnow()
+    since = _coalescing_since(now)
+
+    open_ids = {}
+    task_ids = {row.get('task_id') for row in rows} - {None}
+    if since is not None and task_ids:
+        user_ids = {row['user_id'] for row in rows}
+        # Oldest first, so each (user, task) ends up with its newest open row
+        for notification_id, user_id, task_id in db.session.query(
+            Notification.id, Notification.user_id, Notification.task_id
+        ).filter(
+            Notification.user_id.in_(user_ids),
+            Notification.task_id.in_(task_ids),
+            Notification.is_read == False,
+            Notification.created_at >= since
+        ).order_by(Notification.created_at, Notification.id):
+            open_ids[(user_id, task_id)] = notification_id
+
+    updates, inserts, plain = {}, {}, []
+    coalesced_users = set()
+    for row in rows:
+        key = (row['user_id'], row.get('task_id'))
+        if since is not None and key[1] is not None:
+            if key in open_ids:
+                update = updates.setdefault(open_ids[key], {'b_id': open_ids[key], 'b_repeats': 0})
+                update['b_message'] = row['message']
+                update['b_repeats'] += 1
+                coalesced_users.add(key[0])
+                continue
+            if key in inserts:
+                inserts[key]['message'] = row['message']
+                inserts[key]['repeat_count'] += 1
+                continue
+        new_row = {
+            'user_id': row['user_id'],
+            'task_id': row.get('task_id'),
+            'message': row['message'],
+            'is_read': False,
+            'repeat_count': 1,
+            'created_at': row.get('created_at') or now
+        }
+        if since is not None and key[1] is not None:
+            inserts[key] = new_row
+        else:
+            plain.append(new_row)
+
+    if updates:
+        table = Notification.__table__
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('b_id')).values(
+                message=bindparam('b_message'), created_at=now, repeat_count=table.c.repeat_count + bindparam('b_repeats')
+            ),
+            list(updates.values())
+        )
+        _notifications_changed(coalesced_users)
+
+    new_rows = plain + list(inserts.values())
+    for start in range(0, len(new_rows), INSERT_BATCH_SIZE):
+        db.session.execute(db.insert(Notification).values(new_rows[start:start + INSERT_BATCH_SIZE]))
+    apply_counts(db.session.connection(), Counter(row['user_id'] for row in new_rows))
+    return len(new_rows)
+
+
+def fan_out(criteria, message, task_id=None):
+    """Notify every user matching ``criteria`` with one INSERT ... SELECT from users.
+
+    Users with an open notification about the task (see notify()) get it
+    updated by one UPDATE instead. Returns the number of rows inserted.
+    """
+    now = datetime.utcnow()
+    since = _coalescing_since(now) if task_id is not None else None
+    if since is not None:
+        coalesced = db.session.execute(
+            db.update(Notification).where(
+                Notification.user_id.in_(db.select(User.id).where(criteria)), *_open_for(task_id, since)
+            ).values(
+                message=message, created_at=now, repeat_count=Notification.repeat_count + 1
+            ).returning(Notification.user_id).execution_options(synchronize_session=False)
+        )
+        _notifications_changed(user_id for (user_id,) in coalesced)
+        criteria = db.and_(criteria, ~exists().where(Notification.user_id == User.id, *_open_for(task_id, since)))
+
+    select = db.select(
+        User.id,
+        literal(task_id, db.Integer),
+        literal(message, db.Text),
+        literal(False),
+        literal(1),
+        literal(now, db.DateTime)
+    ).where(criteria)
+    stmt = db.insert(Notification).from_select(
+        ['user_id', 'task_id', 'message', 'is_read', 'repeat_count', 'created_at'], select
+    ).returning(Notification.user_id)
+    user_ids = [user_id for (user_id,) in db.session.execute(stmt)]
+    apply_counts(db.session.connection(), Counter(user_ids))
+    return len(user_ids)
+
+
+def notify_team(team, message, task_id=None):
+    """Notify everyone on a team, as rows or as one broadcast depending on NOTIFICATION_TEAM_MODE."""
+    if current_app.config['NOTIFICATION_TEAM_MODE'] == 'broadcast':
+        db.session.add(NotificationBroadcast(team=team, task_id=task_id, message=message))
+        _count_matching(User.role == team)
+        return
+    fan_out(User.role == team, message, task_id)
+
+
+def _unread_broadcasts(user):
+    query = NotificationBroadcast.query.filter(
+        NotificationBroadcast.team == user.role,
+        ~exists().where(
+            NotificationReceipt.broadcast_id == NotificationBroadcast.id,
+            NotificationReceipt.user_id == user.id
+        )
+    )
+    # Joining a team doesn't bring its old broadcasts with it
+    if user.created_at:
+        query = query.filter(NotificationBroadcast.created_at >= user.created_at)
+    return query
+
+
+def unread_for(user, limit=5):
+    """The user's newest unread notifications and team broadcasts, newest first."""
+    personal = Notification.query.options(joinedload(Notification.task)).filter_by(
+        user_id=user.id,
+        is_read=False
+    ).order_by(Notification.created_at.desc()).limit(limit).all()
+    broadcasts = _unread_broadcasts(user).options(joinedload(NotificationBroadcast.task)).order_by(
+        NotificationBroadcast.created_at.desc()
+    ).limit(limit).all()
+    return sorted(personal + broadcasts, key=lambda item: item.created_at, reverse=True)[:limit]
+
+
+def mark_broadcast_read(user, broadcast_id):
+    """Record the user's read receipt for a team broadcast. Returns False unless it's one they have unread."""
+    # The same test as the counter: a broadcast from before the user joined was never counted
+    if _unread_broadcasts(user).filter(NotificationBroadcast.id == broadcast_id).first() is None:
+        return False
+
+    values = {'broadcast_id': broadcast_id, 'user_id': user.id, 'read_at': datetime.utcnow()}
+    insert = upserts.insert_for(db.session.connection())
+    if insert is not None:
+        inserted = db.session.execute(insert(NotificationReceipt).values(**values).on_conflict_do_nothing()).rowcount
+    else:
+        inserted = 0
+        if not db.session.get(NotificationReceipt, (broadcast_id, user.id)):
+            db.session.add(NotificationReceipt(**values))
+            inserted = 1
+    if inserted:
+        apply_counts(db.session.connection(), {user.id: -1})
+    return True
+
+
+def mark_read(user, task_id=None, ids=None):
+    """Mark the user's unread notifications read: all of them, one task's, or the given ids.
+
+    One UPDATE scoped by user_id; without ``ids`` the user's unread team
+    broadcasts get read receipts too. Returns how many became read.
+    """
+    criteria = [Notification.user_id == user.id, Notification.is_read == False]
+    if task_id is not None:
+        criteria.append(Notification.task_id == task_id)
+    if ids is not None:
+        criteria.append(Notification.id.in_(ids))
+    updated = db.session.execute(
+        db.update(Notification).where(*criteria).values(is_read=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    if ids is None:
+        broadcasts = _unread_broadcasts(user)
+        if task_id is not None:
+            broadcasts = broadcasts.filter(NotificationBroadcast.task_id == task_id)
+        source = broadcasts.with_entities(
+            NotificationBroadcast.id, literal(user.id), literal(datetime.utcnow(), db.DateTime)
+        ).statement
+        columns = ['broadcast_id', 'user_id', 'read_at']
+        insert = upserts.insert_for(db.session.connection())
+        if insert is None:
+            stmt = db.insert(NotificationReceipt).from_select(columns, source)
+        else:
+            # A receipt written meanwhile by a single mark-read is left as it is
+            stmt = insert(NotificationReceipt).from_select(columns, source).on_conflict_do_nothing()
+        updated += db.session.execute(stmt).rowcount
+
+    if updated:
+        apply_counts(db.session.connection(), {user.id: -updated})
+    return updated
+
+
+def unread_count(user_id):
+    """(unread count, counter version) for a user, straight from the counter row."""
+    row = db.session.query(NotificationCounter.unread_count, NotificationCounter.version).filter_by(
+        user_id=user_id
+    ).first()
+    return tuple(row) if row else (0, 0)
+
+
+def apply_counts(connection, counts):
+    """Add ``{user_id: change}`` to the unread counters."""
+    # Sorted so concurrent transactions lock counter rows in the same order
+    rows = [
+        {'user_id': user_id, 'unread_count': change, 'version': 1}
+        for user_id, change in sorted(counts.items()) if change
+    ]
+    if not rows:
+        return
+
+    table = NotificationCounter.__table__
+    upserts.add(connection, table, ['user_id'], rows, ['unread_count'], also={'version': table.c.version + 1})
+
+    # A counter never goes below zero, whatever a decrement it didn't expect says
+    lowered = [row['user_id'] for row in rows if row['unread_count'] < 0]
+    if lowered:
+        connection.execute(
+            table.update().where(table.c.user_id.in_(lowered), table.c.unread_count < 0).values(unread_count=0)
+        )
+
+    for row in rows:
+        events.emit(f"user:{row['user_id']}", 'notifications', {'change': row['unread_count']})
+
+
+def _count_matching(criteria):
+    """Add one unread notification to the counter of every user matching ``criteria``."""
+    connection = db.session.connection()
+    insert = upserts.insert_for(connection)
+    if insert is None:
+        apply_counts(connection, {user_id: 1 for (user_id,) in db.session.query(User.id).filter(criteria)})
+        return
+    table = NotificationCounter.__table__
+    select = db.select(User.id, literal(1), literal(1)).where(criteria)
+    stmt = insert(table).from_select(['user_id', 'unread_count', 'version'], select)
+    stmt = upserts.on_conflict_add(stmt, ['user_id'], ['unread_count'], {'version': table.c.version + 1})
+    for (user_id,) in connection.execute(stmt.returning(table.c.user_id)):
+        events.emit(f'user:{user_id}', 'notifications', {'change': 1})
+
+
+def _previous_unread_user(notification):
+    # The user whose counter the notification counted towards before this flush, if unread
+    state = inspect(notification)
+    user_id, is_read = (
+        (history.deleted or history.unchanged or [None])[0]
+        for history in (state.attrs[name].load_history() for name in ('user_id', 'is_read'))
+    )
+    return None if is_read else user_id
+
+
+@event.listens_for(Session, 'before_flush')
+def _remember_read_state(session, flush_context, instances):
+    previous = session.info.setdefault('notification_unread_previous', {})
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Notification) and obj not in previous and inspect(obj).persistent:
+            previous[obj] = _previous_unread_user(obj)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_counters(session, flush_context):
+    counts = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, Notification) and not obj.is_read:
+            counts[obj.user_id] += 1
+    for obj, old_user_id in session.info.pop('notification_unread_previous', {}).items():
+        if old_user_id is not None:
+            counts[old_user_id] -= 1
+        if obj not in session.deleted and not obj.is_read:
+            counts[obj.user_id] += 1
+    if any(counts.values()):
+        apply_counts(session.connection(), counts)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_read_state(session, previous_transaction):
+    session.info.pop('notification_unread_previous', None)
+
+
+def recount():
+    """Recompute every user's unread counter. Returns the number of users with unread notifications."""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        # Hold off new notifications so the recount and live increments can't interleave
+        connection.execute(text('LOCK TABLE notifications, notification_receipts IN SHARE MODE'))
+
+    counts = Counter(dict(
+        db.session.query(Notification.user_id, func.count()).filter(
+            Notification.is_read == False
+        ).group_by(Notification.user_id)
+    ))
+    broadcasts = db.session.query(User.id, func.count()).join(
+        NotificationBroadcast, NotificationBroadcast.team == User.role
+    ).filter(
+        or_(User.created_at.is_(None), NotificationBroadcast.created_at >= User.created_at),
+        ~exists().where(
+            NotificationReceipt.broadcast_id == NotificationBroadcast.id,
+            NotificationReceipt.user_id == User.id
+        )
+    ).group_by(User.id)
+    counts.update(dict(broadcasts))
+
+    table = NotificationCounter.__table__
+    connection.execute(table.update().values(unread_count=0, version=table.c.version + 1))
+    apply_counts(connection, counts)
+    db.session.commit()
+    return len(counts)
+
+
+def prune(older_than, archive=True, batch_size=PRUNE_BATCH_SIZE, pause=0):
+    """Archive (or delete) read notifications created before ``older_than``, one batch per transaction.
+
+    Yields the number of rows handled by each batch. Unread notifications are
+    never touched, so the unread counters stay as they are.
+    """
+    columns = ['id', 'user_id', 'task_id', 'message', 'repeat_count', 'created_at']
+    while True:
+        # Oldest first along ix_notifications_read_created_at; rows another
+        # transaction holds are left for the next run
+        ids = [notification_id for (notification_id,) in db.session.query(Notification.id).filter(
+            Notification.is_read == True,
+            Notification.created_at < older_than
+        ).order_by(Notification.created_at, Notification.id).limit(batch_size).with_for_update(skip_locked=True)]
+        if not ids:
+            db.session.commit()
+            return
+
+        if archive:
+            source = db.select(
+                *(getattr(Notification, name) for name in columns),
+                literal(datetime.utcnow(), db.DateTime)
+            ).where(Notification.id.in_(ids))
+            db.session.execute(db.insert(NotificationArchive).from_select(columns + ['archived_at'], source))
+        db.session.execute(db.delete(Notification).where(Notification.id.in_(ids)).execution_options(synchronize_session=False))
+        db.session.commit()
+        yield len(ids)
+
+        if len(ids) < batch_size:
+            return
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,113 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, expected_length):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != expected_length:
+        return None
+    try:
+        return [_decode_value(v) for v in values]
+    except ValueError:
+        return None
+
+
+def _seek_predicate(keys, values, forward):
+    # (k1, k2, ...) strictly after/before the cursor row, honouring each key's direction:
+    # k1 beyond v1 OR (k1 = v1 AND k2 beyond v2) OR ...
+    clauses = []
+    for i, (expr, descending) in enumerate(keys):
+        goes_down = descending == forward
+        beyond = expr < values[i] if goes_down else expr > values[i]
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, beyond))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, keys, per_page, after=None, before=None):
+    """Paginate a single-entity query by seeking on ``keys``.
+
+    ``keys`` is a list of ``(expression, descending)`` pairs that must end in a
+    unique column (normally the primary key). ``after`` / ``before`` are the
+    opaque cursors handed out as ``next_cursor`` / ``prev_cursor``.
+    """
+    after_values = decode_cursor(after, len(keys))
+    before_values = decode_cursor(before, len(keys)) if after_values is None else None
+    backwards = before_values is not None
+
+    labelled = [expr.label(f'_keyset_{i}') for i, (expr, _) in enumerate(keys)]
+    query = query.order_by(None).add_columns(*labelled)
+
+    if after_values is not None:
+        query = query.filter(_seek_predicate(keys, after_values, forward=True))
+    elif backwards:
+        query = query.filter(_seek_predicate(keys, before_values, forward=False))
+
+    ordering = []
+    for expr, descending in keys:
+        # Walk backwards from a 'before' cursor, then flip the rows into display order
+        use_desc = descending != backwards
+        ordering.append(expr.desc() if use_desc else expr.asc())
+
+    rows = query.order_by(*ordering).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first_key = list(rows[0][1:]) if rows else None
+    last_key = list(rows[-1][1:]) if rows else None
+
+    if backwards:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after_values is not None
+
+    return KeysetPage(
+        items,
+        per_page,
+        next_cursor=encode_cursor(last_key) if has_next and last_key else None,
+        prev_cursor=encode_cursor(first_key) if has_prev and first_key else None
+    )
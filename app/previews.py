@@ -0,0 +1,227 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from flask import abort, current_app, has_app_context, send_file
+from sqlalchemy import event, select, union
+from sqlalchemy.orm import Session
+from app import db, blobs
+from app.models import Ad, TaskFile
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Thumbnails of images and first-page previews of PDFs, so ads and task files
+# can be judged without downloading the original. A preview belongs to the
+# blob, not the row: rows sharing content share one, named by its SHA-256.
+#
+# Committing a new Ad or TaskFile queues its blob on a small process pool
+# (PREVIEW_WORKERS per app process), off the request path; when a render
+# finishes, every row of that blob gets preview_path. Jobs lost to a restart,
+# and files uploaded before previews existed, are made by
+# `flask previews generate`.
+#
+# Optional tools: Pillow for images (and WebP output), poppler's pdftoppm for
+# PDFs. Without Pillow, PDF previews are written as JPEG; file types nothing
+# installed can read are skipped.
+
+log = logging.getLogger(__name__)
+
+IMAGE_TYPES = {'png', 'jpg', 'jpeg', 'gif', 'psd'}
+# Illustrator files saved with PDF compatibility open as PDFs
+PDF_TYPES = {'pdf', 'ai'}
+
+PREVIEW_MODELS = (Ad, TaskFile)
+
+# Seconds one pdftoppm run may take before the preview is given up
+RENDER_TIMEOUT = 60
+
+_pool = None
+
+
+def _pdftoppm():
+    return shutil.which('pdftoppm')
+
+
+def preview_format():
+    return 'webp' if Image is not None else 'jpg'
+
+
+def can_render(file_type):
+    file_type = (file_type or '').lower()
+    if file_type in IMAGE_TYPES:
+        return Image is not None
+    if file_type in PDF_TYPES:
+        return _pdftoppm() is not None
+    return False
+
+
+def path_for(sha256):
+    return blobs.shard_path(current_app.config['PREVIEW_FOLDER'], sha256, f'{sha256}.{preview_format()}')
+
+
+def _save(image, target, size):
+    image.thumbnail((size, size))
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P', 'PA') else 'RGB')
+    image.save(target, 'WEBP', quality=80, method=4)
+
+
+def _render_image(source, target, size):
+    with Image.open(source) as image:
+        # Lets JPEG decode at a fraction of full size
+        image.draft('RGB', (size, size))
+        _save(image, target, size)
+
+
+def _render_pdf(source, target, size):
+    prefix = target + '-page'
+    output = prefix + ('.png' if Image is not None else '.jpg')
+    command = [_pdftoppm(), '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(size)]
+    command += ['-png'] if Image is not None else ['-jpeg', '-jpegopt', 'quality=80']
+    try:
+        subprocess.run(command + [source, prefix], check=True, capture_output=True, timeout=RENDER_TIMEOUT)
+        if Image is None:
+            os.replace(output, target)
+        else:
+            with Image.open(output) as image:
+                _save(image, target, size)
+    finally:
+        if os.path.exists(output):
+            os.remove(output)
+
+
+def render(source, file_type, target, size):
+    """Write a preview of ``source`` to ``target``. Runs in a pool process; returns whether it could."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.render-')
+    os.close(fd)
+    try:
+        if file_type in PDF_TYPES:
+            _render_pdf(source, tmp, size)
+        else:
+            _render_image(source, tmp, size)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+        return True
+    except Exception as error:
+        log.warning('No preview for %s (%s): %r', source, file_type, error)
+        return False
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def record(sha256, path):
+    """Point every row of the blob that has no preview yet at ``path``."""
+    for model in PREVIEW_MODELS:
+        db.session.execute(
+            db.update(model).where(model.blob_sha256 == sha256, model.preview_path.is_(None)).values(preview_path=path)
+        )
+    db.session.commit()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        # Not forked: app processes run threads, and a fork copies whatever locks they held
+        _pool = ProcessPoolExecutor(
+            max_workers=current_app.config['PREVIEW_WORKERS'],
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _pool
+
+
+def _rendered(app, sha256, target, future):
+    if future.cancelled() or future.exception() or not future.result():
+        return
+    with app.app_context():
+        try:
+            record(sha256, target)
+        finally:
+            db.session.remove()
+
+
+def schedule(jobs):
+    """Render previews of {sha256: file_type} in the background and record them when done."""
+    global _pool
+    if not current_app.config['PREVIEW_WORKERS']:
+        return
+    app = current_app._get_current_object()
+    size = current_app.config['PREVIEW_SIZE']
+    for sha256, file_type in jobs.items():
+        target = path_for(sha256)
+        try:
+            future = _executor().submit(render, blobs.stored_path(sha256), file_type, target, size)
+        except BrokenProcessPool:
+            # A render took its worker down; start afresh next time, and leave this one to `generate`
+            log.warning('Preview pool broke; previews will be made by flask previews generate')
+            _pool = None
+            return
+        future.add_done_callback(partial(_rendered, app, sha256, target))
+
+
+def missing():
+    """(sha256, file_type) of every blob with a row still lacking a preview that could be made."""
+    pending = union(*[
+        select(model.blob_sha256, model.file_type).where(
+            model.blob_sha256.isnot(None), model.preview_path.is_(None)
+        ) for model in PREVIEW_MODELS
+    ])
+    found = {}
+    for sha256, file_type in db.session.execute(pending):
+        file_type = (file_type or '').lower()
+        if can_render(file_type):
+            found.setdefault(sha256, file_type)
+    return list(found.items())
+
+
+def send(preview_path, sha256):
+    """Send a preview. Its content never changes, so browsers may keep it for PREVIEW_MAX_AGE."""
+    if not preview_path:
+        abort(404)
+    path = os.path.abspath(preview_path)
+    if not os.path.isfile(path):
+        # Moved by `flask blobs shard` since the row was read
+        path = os.path.abspath(path_for(sha256))
+        if not os.path.isfile(path):
+            abort(404)
+    response = send_file(path, max_age=current_app.config['PREVIEW_MAX_AGE'])
+    # Named by its blob's hash, so it never changes; private, as downloads are
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
+@event.listens_for(Session, 'before_flush')
+def _queue_new_previews(session, flush_context, instances):
+    for obj in session.new:
+        if not isinstance(obj, PREVIEW_MODELS) or not obj.blob_sha256 or obj.preview_path:
+            continue
+        file_type = (obj.file_type or '').lower()
+        if not has_app_context() or not can_render(file_type):
+            continue
+        path = path_for(obj.blob_sha256)
+        if os.path.exists(path):
+            obj.preview_path = path
+        else:
+            session.info.setdefault('pending_previews', {})[obj.blob_sha256] = file_type
+
+
+@event.listens_for(Session, 'after_commit')
+def _start_previews(session):
+    jobs = session.info.pop('pending_previews', None)
+    if jobs and has_app_context():
+        schedule(jobs)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_previews(session, previous_transaction):
+    session.info.pop('pending_previews', None)
@@ -0,0 +1,160 @@
+from collections import namedtuple
+from flask import current_app, g, has_app_context
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from app import db, upserts
+from app.models import CacheVersion, Task, User
+
+# Department -> managers and members, for routing tasks without scanning the
+# users table on every transition. Each process keeps one snapshot of the
+# directory; a change to users bumps the shared 'routing' stamp in
+# cache_versions, and a process rebuilds its snapshot once it sees a stamp it
+# didn't build from. The stamp is read at most once per request.
+
+# User attributes the directory is built from
+ROUTING_ATTRIBUTES = ('username', 'department', 'is_manager')
+
+STAMP = 'routing'
+
+Member = namedtuple('Member', 'id username department is_manager')
+
+
+class Directory:
+    def __init__(self, stamp, users):
+        self.stamp = stamp
+        self.members = {}
+        self.managers = {}
+        for user in users:
+            self.members.setdefault(user.department, []).append(user)
+            if user.is_manager:
+                self.managers.setdefault(user.department, []).append(user)
+
+
+_snapshot = None
+
+
+def _bump(connection, name):
+    """Add one to the named counter, creating it if needed, and return the new value."""
+    [(version,)] = upserts.add(
+        connection, CacheVersion.__table__, ['name'], [{'name': name, 'version': 1}], ['version'], returning=['version']
+    )
+    return version
+
+
+def _current_stamp():
+    if has_app_context() and 'routing_stamp' in g:
+        return g.routing_stamp
+    stamp = db.session.execute(select(CacheVersion.version).where(CacheVersion.name == STAMP)).scalar() or 0
+    if has_app_context():
+        g.routing_stamp = stamp
+    return stamp
+
+
+def directory():
+    """The routing Directory, rebuilt when another process or commit has changed users."""
+    global _snapshot
+    stamp = _current_stamp()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.stamp != stamp:
+        rows = db.session.execute(
+            select(User.id, User.username, User.department, User.is_manager).order_by(User.id)
+        )
+        snapshot = Directory(stamp, [Member(*row) for row in rows])
+        # Users changed in this transaction may yet be rolled back: use them but don't share them
+        if not db.session.info.get('routing_changed'):
+            _snapshot = snapshot
+    return snapshot
+
+
+def members(department):
+    """Everyone in the department, managers included, by id."""
+    return list(directory().members.get(department, ()))
+
+
+def managers(department):
+    return list(directory().managers.get(department, ()))
+
+
+def _open_tasks(user_ids):
+    counts = dict(
+        db.session.query(Task.assigned_to_id, func.count(Task.id)).filter(
+            Task.assigned_to_id.in_(user_ids),
+            Task.is_archived == False,
+            Task.status.notin_(['Completed', 'Archived'])
+        ).group_by(Task.assigned_to_id)
+    )
+    return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+
+def manager_for(department, assigned=None):
+    """The manager new work for ``department`` goes to, or None.
+
+    With a single manager that is always them. Otherwise ROUTING_MANAGER_SELECTION
+    decides: 'first' is the longest-standing manager, 'round_robin' takes turns
+    through a counter shared by all workers, and 'least_loaded' picks whoever
+    has the fewest open tasks, counting ``assigned`` ({user_id: tasks}) as work
+    handed out in this transaction but not yet written. Ties go to the lowest id.
+    """
+    candidates = managers(department)
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+
+    selection = current_app.config['ROUTING_MANAGER_SELECTION']
+    if selection == 'round_robin':
+        turn = _bump(db.session.connection(), f'{STAMP}:round_robin:{department}')
+        return candidates[(turn - 1) % len(candidates)]
+    if selection == 'least_loaded':
+        load = _open_tasks([manager.id for manager in candidates])
+        for user_id, count in (assigned or {}).items():
+            if user_id in load:
+                load[user_id] += count
+        return min(candidates, key=lambda manager: (load[manager.id], manager.id))
+    return candidates[0]
+
+
+def _changed(session):
+    _bump(session.connection(), STAMP)
+    session.info['routing_changed'] = True
+    # Later lookups in this request should see the change too
+    if has_app_context():
+        g.pop('routing_stamp', None)
+
+
+def invalidate():
+    """Make every process rebuild its directory, e.g. after editing users with plain SQL."""
+    _changed(db.session)
+
+
+@event.listens_for(Session, 'before_flush')
+def _detect_user_changes(session, flush_context, instances):
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if obj in session.new or obj in session.deleted or any(
+            state.attrs[name].history.has_changes() for name in ROUTING_ATTRIBUTES
+        ):
+            session.info['routing_dirty'] = True
+            return
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_stamp(session, flush_context):
+    if session.info.pop('routing_dirty', False):
+        _changed(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_snapshot(session):
+    global _snapshot
+    if session.info.pop('routing_changed', False):
+        _snapshot = None
+        if has_app_context():
+            g.pop('routing_stamp', None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_user_changes(session, previous_transaction):
+    session.info.pop('routing_dirty', None)
+    if session.info.pop('routing_changed', False) and has_app_context():
+        g.pop('routing_stamp', None)
@@ -0,0 +1,157 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import event, func, literal_column, select, table, column, cast, Float, DDL
+from app import db
+from app.models import Task
+
+# Text search configuration for Postgres. 'simple' keeps company names and
+# product terms intact instead of stemming them.
+TS_CONFIG = 'simple'
+
+# Highlight markers used inside the database, swapped for <mark> after escaping
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_STOP = '\x03'
+
+SNIPPET_WORDS = 16
+
+tasks_fts = table('tasks_fts', column('rowid'), column('company_name'), column('title'), column('description'))
+
+POSTGRES_DDL = [
+    f"""ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(company_name, '')), 'A') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(title, '')), 'B') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(description, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN (search_vector)",
+]
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        company_name, title, description,
+        content='tasks', content_rowid='id', tokenize='unicode61', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, company_name, title, description)
+        VALUES (new.id, new.company_name, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, company_name, title, description)
+        VALUES ('delete', old.id, old.company_name, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF company_name, title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, company_name, title, description)
+        VALUES ('delete', old.id, old.company_name, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, company_name, title, description)
+        VALUES (new.id, new.company_name, new.title, new.description);
+    END""",
+]
+
+
+def _install_search(target, connection, **kw):
+    statements = {'postgresql': POSTGRES_DDL, 'sqlite': SQLITE_DDL}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(DDL(statement))
+
+
+# db.create_all() gets the same search objects the migration installs
+event.listen(Task.__table__, 'after_create', _install_search)
+
+
+def is_search_object(name, type_):
+    """Whether a schema object is one of the above, which the models don't declare."""
+    if type_ == 'table':
+        return name == 'tasks_fts' or name.startswith('tasks_fts_')
+    return (type_, name) in (('column', 'search_vector'), ('index', 'ix_tasks_search_vector'))
+
+
+def search_terms(search_query):
+    return re.findall(r'\w+', search_query or '', re.UNICODE)[:10]
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _pg_tsquery(terms):
+    return func.to_tsquery(TS_CONFIG, ' & '.join(f'{term}:*' for term in terms))
+
+
+def _fts5_query(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def filter_tasks(query, search_query):
+    """Restrict a Task query to rows matching the search terms."""
+    terms = search_terms(search_query)
+    if not terms:
+        return query
+
+    dialect = _dialect()
+
+    if dialect == 'postgresql':
+        return query.filter(literal_column('tasks.search_vector').op('@@')(_pg_tsquery(terms)))
+
+    if dialect == 'sqlite':
+        return query.join(tasks_fts, tasks_fts.c.rowid == Task.id).filter(
+            literal_column('tasks_fts').op('MATCH')(_fts5_query(terms))
+        )
+
+    # Every term must match, as in the full-text queries above
+    like_filter = db.and_(*[
+        Task.company_name.ilike(f'%{term}%') | Task.title.ilike(f'%{term}%') | Task.description.ilike(f'%{term}%')
+        for term in terms
+    ])
+    return query.filter(like_filter)
+
+
+def rank(search_query):
+    """Relevance of a row from filter_tasks(), higher is better; None when unranked."""
+    terms = search_terms(search_query)
+    if not terms:
+        return None
+
+    dialect = _dialect()
+
+    if dialect == 'postgresql':
+        # float8 so the value survives a round trip through a pagination cursor
+        return cast(func.ts_rank_cd(literal_column('tasks.search_vector'), _pg_tsquery(terms)), Float)
+
+    if dialect == 'sqlite':
+        return -func.bm25(literal_column('tasks_fts'), 10.0, 5.0, 1.0)
+
+    return None
+
+
+def _highlight(raw):
+    # Escape the stored text first so only our own markers become HTML
+    text = str(escape(raw))
+    return Markup(text.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>'))
+
+
+def task_snippets(task_ids, search_query):
+    """Highlighted description snippets for the given task ids, keyed by id."""
+    terms = search_terms(search_query)
+    if not terms or not task_ids:
+        return {}
+
+    dialect = _dialect()
+
+    if dialect == 'postgresql':
+        options = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords={SNIPPET_WORDS}, MinWords=5'
+        snippet = func.ts_headline(TS_CONFIG, func.coalesce(Task.description, ''), _pg_tsquery(terms), options)
+        stmt = select(Task.id, snippet).where(Task.id.in_(task_ids))
+    elif dialect == 'sqlite':
+        fts = literal_column('tasks_fts')
+        snippet = func.snippet(fts, 2, HIGHLIGHT_START, HIGHLIGHT_STOP, '…', SNIPPET_WORDS)
+        stmt = select(tasks_fts.c.rowid, snippet).where(
+            fts.op('MATCH')(_fts5_query(terms)),
+            tasks_fts.c.rowid.in_(task_ids)
+        )
+    else:
+        return {}
+
+    return {
+        task_id: _highlight(raw)
+        for task_id, raw in db.session.execute(stmt)
+        if raw and HIGHLIGHT_START in raw
+    }
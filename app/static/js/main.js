@@ -14,4 +14,153 @@ document.addEventListener('DOMContentLoaded', function() {
             link.classList.add('active');
         }
     });
+
+    // Forms with data-chunked-upload send their files ahead in resumable chunks,
+    // then post the form with the finished uploads' ids instead of the files
+    document.querySelectorAll('form[data-chunked-upload]').forEach(form => {
+        const input = form.querySelector('input[type="file"][name="files"]');
+        if (!input || !window.fetch || !window.Blob || !Blob.prototype.slice) return;
+        form.addEventListener('submit', async (event) => {
+            if (!input.files.length || form.dataset.uploaded) return;
+            event.preventDefault();
+            const button = form.querySelector('[type="submit"]');
+            const label = button ? button.innerHTML : '';
+            if (button) button.disabled = true;
+            try {
+                for (const file of Array.from(input.files)) {
+                    const id = await uploadInChunks(form.dataset.chunkedUpload, file, (done) => {
+                        if (button) button.textContent = `Uploading ${file.name}: ${Math.floor(done * 100)}%`;
+                    });
+                    const hidden = document.createElement('input');
+                    hidden.type = 'hidden';
+                    hidden.name = 'upload_ids';
+                    hidden.value = id;
+                    form.appendChild(hidden);
+                }
+                // The bytes are already on the server; don't post them again
+                input.disabled = true;
+                form.dataset.uploaded = '1';
+                form.submit();
+            } catch (error) {
+                if (button) {
+                    button.disabled = false;
+                    button.innerHTML = label;
+                }
+                alert(`Upload failed: ${error.message} Submit again to resume where it stopped.`);
+            }
+        });
+    });
+
+    const badge = document.getElementById('notification-badge');
+    if (badge) {
+        let streaming = false;
+        let lastRefresh = 0;
+        // no-cache makes the browser revalidate with If-None-Match; unchanged counts come back as 304
+        const refreshBadge = (force) => {
+            if (document.hidden) return;
+            // While streaming, poll only once a minute as a backstop for missed events
+            if (streaming && force !== true && Date.now() - lastRefresh < 60000) return;
+            lastRefresh = Date.now();
+            fetch(badge.dataset.url, { cache: 'no-cache', credentials: 'same-origin' })
+                .then(response => response.ok ? response.json() : null)
+                .then(data => {
+                    if (!data) return;
+                    badge.textContent = data.unread;
+                    badge.classList.toggle('d-none', data.unread === 0);
+                })
+                .catch(() => {});
+        };
+        refreshBadge();
+        setInterval(refreshBadge, 10000);
+        document.addEventListener('visibilitychange', refreshBadge);
+
+        // Live updates; polling above slows down while the stream is open
+        if (window.EventSource) {
+            const source = new EventSource(badge.dataset.streamUrl);
+            source.addEventListener('open', () => { streaming = true; });
+            source.addEventListener('error', () => { streaming = false; });
+            source.addEventListener('notifications', () => refreshBadge(true));
+            source.addEventListener('resync', () => refreshBadge(true));
+            source.addEventListener('task', (event) => {
+                const task = JSON.parse(event.data);
+                const page = document.querySelector(`[data-live-task="${task.id}"]`);
+                if (page && !page.querySelector('.live-task-notice')) {
+                    const notice = document.createElement('div');
+                    notice.className = 'alert alert-info live-task-notice';
+                    notice.innerHTML = 'This task was just updated. <a href="" class="alert-link">Reload</a> to see the changes.';
+                    page.prepend(notice);
+                }
+            });
+        }
+    }
 });
+
+const hexDigest = (buffer) => Array.from(new Uint8Array(buffer), byte => byte.toString(16).padStart(2, '0')).join('');
+
+// fetch() with a few retries, backing off, for requests that are safe to repeat
+async function fetchWithRetry(url, options, attempts = 5) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const response = await fetch(url, Object.assign({ credentials: 'same-origin' }, options));
+            if (response.status < 500 || attempt === attempts) return response;
+        } catch (error) {
+            if (attempt === attempts) throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+    }
+}
+
+async function failure(response) {
+    const data = await response.json().catch(() => ({}));
+    return new Error(data.error || `Server responded ${response.status}.`);
+}
+
+// Upload one file through /uploads and return its id. Progress is kept by the
+// server, so a later call for the same file resumes from the last stored chunk.
+async function uploadInChunks(createUrl, file, onProgress) {
+    const key = `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+    let upload = null;
+    if (localStorage.getItem(key)) {
+        const response = await fetchWithRetry(localStorage.getItem(key), { cache: 'no-store' });
+        if (response.ok) upload = await response.json();
+    }
+    if (!upload) {
+        const response = await fetchWithRetry(createUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        if (!response.ok) throw await failure(response);
+        upload = await response.json();
+        localStorage.setItem(key, upload.url);
+    }
+
+    let offset = upload.offset;
+    while (!upload.complete && offset < file.size) {
+        const chunk = file.slice(offset, Math.min(offset + upload.chunk_size, file.size));
+        const headers = { 'Content-Range': `bytes ${offset}-${offset + chunk.size - 1}/${file.size}` };
+        if (window.crypto && crypto.subtle) {
+            headers['X-Chunk-SHA256'] = hexDigest(await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer()));
+        }
+        const response = await fetchWithRetry(upload.url, { method: 'PUT', headers, body: chunk });
+        if (response.status === 409) {
+            // Out of step with the server: carry on from where it says it is
+            offset = (await response.json()).offset;
+            continue;
+        }
+        if (!response.ok) {
+            if (response.status === 404 || response.status === 410) localStorage.removeItem(key);
+            throw await failure(response);
+        }
+        offset = parseInt(response.headers.get('Upload-Offset'), 10);
+        onProgress(offset / file.size);
+    }
+
+    const response = await fetchWithRetry(`${upload.url}/complete`, { method: 'POST' });
+    if (!response.ok) {
+        if (response.status === 422) localStorage.removeItem(key);
+        throw await failure(response);
+    }
+    localStorage.removeItem(key);
+    return upload.id;
+}
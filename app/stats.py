@@ -0,0 +1,164 @@
+from collections import defaultdict
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.orm import Session
+from app import db, upserts
+from app.models import Task, Brand, Edition, BrandStats, EditionStats
+
+# Task columns that decide which rollup buckets a task counts towards
+TRACKED_ATTRIBUTES = ('brand_id', 'edition_id', 'status', 'current_department')
+
+
+# Make sure the pre-change value is loaded before it is overwritten, so the
+# flush hook can always take the task out of its old bucket.
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+for _name in TRACKED_ATTRIBUTES:
+    event.listen(getattr(Task, _name), 'set', _keep_old_value, active_history=True, retval=True)
+
+
+def _buckets(values):
+    status = values['status'] or ''
+    department = values['current_department'] or ''
+    if values['brand_id'] is not None:
+        yield BrandStats, values['brand_id'], status, department
+    if values['edition_id'] is not None:
+        yield EditionStats, values['edition_id'], status, department
+
+
+def tracked_values(task):
+    return {name: getattr(task, name) for name in TRACKED_ATTRIBUTES}
+
+
+def _previous_values(task):
+    state = inspect(task)
+    values = {}
+    for name in TRACKED_ATTRIBUTES:
+        history = state.attrs[name].load_history()
+        if history.deleted:
+            values[name] = history.deleted[0]
+        elif history.unchanged:
+            values[name] = history.unchanged[0]
+        else:
+            values[name] = None
+    return values
+
+
+def add_delta(deltas, values, change):
+    for bucket in _buckets(values):
+        deltas[bucket] += change
+
+
+@event.listens_for(Session, 'before_flush')
+def _remember_previous_values(session, flush_context, instances):
+    # Read while the database still holds the old rows; foreign keys set through
+    # relationships are only synced during the flush, so new values wait for after_flush.
+    previous = session.info.setdefault('task_stats_previous', {})
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Task) and obj not in previous and inspect(obj).persistent:
+            previous[obj] = _previous_values(obj)
+
+
+def _collect_deltas(session):
+    deltas = defaultdict(int)
+    previous = session.info.pop('task_stats_previous', {})
+
+    for obj in session.new:
+        if isinstance(obj, Task):
+            add_delta(deltas, tracked_values(obj), 1)
+
+    for obj, old_values in previous.items():
+        if obj in session.deleted:
+            add_delta(deltas, old_values, -1)
+            continue
+        new_values = tracked_values(obj)
+        if new_values != old_values:
+            add_delta(deltas, old_values, -1)
+            add_delta(deltas, new_values, 1)
+
+    # Rollup rows of brands/editions deleted in this flush go with them (ON DELETE CASCADE)
+    deleted_brands = {obj.id for obj in session.deleted if isinstance(obj, Brand)}
+    deleted_editions = {obj.id for obj in session.deleted if isinstance(obj, Edition)}
+
+    return {
+        bucket: change for bucket, change in deltas.items()
+        if change and not (
+            (bucket[0] is BrandStats and bucket[1] in deleted_brands) or
+            (bucket[0] is EditionStats and bucket[1] in deleted_editions)
+        )
+    }
+
+
+def _key_column(model):
+    return 'brand_id' if model is BrandStats else 'edition_id'
+
+
+def apply_deltas(connection, deltas):
+    """Add ``{(model, key_id, status, department): change}`` to the rollup tables."""
+    rows_by_model = defaultdict(list)
+    # Sorted so concurrent transactions touch rollup rows in the same order
+    for (model, key_id, status, department), change in sorted(deltas.items(), key=lambda item: (item[0][0].__tablename__,) + item[0][1:]):
+        rows_by_model[model].append({
+            _key_column(model): key_id,
+            'status': status,
+            'department': department,
+            'task_count': change
+        })
+
+    for model, rows in rows_by_model.items():
+        upserts.add(connection, model.__table__, [_key_column(model), 'status', 'department'], rows, ['task_count'])
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_rollups(session, flush_context):
+    deltas = _collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_previous_values(session, previous_transaction):
+    session.info.pop('task_stats_previous', None)
+
+
+def rebuild():
+    """Recompute both rollup tables from tasks. Returns (brand rows, edition rows)."""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        # Hold off task writes so the recount and the live deltas can't interleave
+        connection.execute(text('LOCK TABLE tasks IN SHARE MODE'))
+
+    counts = []
+    for model, key_column in ((BrandStats, Task.brand_id), (EditionStats, Task.edition_id)):
+        status = func.coalesce(Task.status, '')
+        department = func.coalesce(Task.current_department, '')
+        source = select(key_column, status, department, func.count()).where(
+            key_column.isnot(None)
+        ).group_by(key_column, status, department)
+
+        connection.execute(model.__table__.delete())
+        connection.execute(model.__table__.insert().from_select(
+            [_key_column(model), 'status', 'department', 'task_count'], source
+        ))
+        counts.append(db.session.query(model).count())
+
+    db.session.commit()
+    return tuple(counts)
+
+
+def edition_totals():
+    """Subquery of edition_id, task_count, completed_count from the rollup."""
+    return db.session.query(
+        EditionStats.edition_id.label('edition_id'),
+        func.sum(EditionStats.task_count).label('task_count'),
+        func.sum(db.case((EditionStats.status == 'Completed', EditionStats.task_count), else_=0)).label('completed_count')
+    ).group_by(EditionStats.edition_id).subquery()
+
+
+def brand_totals():
+    """Subquery of brand_id, task_count from the rollup."""
+    return db.session.query(
+        BrandStats.brand_id.label('brand_id'),
+        func.sum(BrandStats.task_count).label('task_count')
+    ).group_by(BrandStats.brand_id).subquery()
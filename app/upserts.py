@@ -0,0 +1,54 @@
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Insert-or-add for the counter tables (rollups, unread counters, blob
+# references, cache versions), which many transactions write at once.
+# PostgreSQL and SQLite do it in one INSERT ... ON CONFLICT statement; any
+# other database gets an UPDATE, and an INSERT when that matched nothing.
+
+
+def insert_for(connection):
+    """The dialect's INSERT construct, which has on_conflict_do_*(), or None where there is none."""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert
+    if dialect == 'sqlite':
+        return sqlite.insert
+    return None
+
+
+def on_conflict_add(stmt, keys, columns, also=None):
+    """Make an INSERT from insert_for() add its ``columns`` to the row already there with the same ``keys``.
+
+    ``also`` sets further columns on that row, e.g. {'version': table.c.version + 1}.
+    """
+    table = stmt.table
+    set_ = {name: table.c[name] + stmt.excluded[name] for name in columns}
+    set_.update(also or {})
+    return stmt.on_conflict_do_update(index_elements=keys, set_=set_)
+
+
+def add(connection, table, keys, rows, columns, also=None, returning=()):
+    """Add each row's ``columns`` to the row with the same ``keys``, inserting the row where there is none.
+
+    ``rows`` must not repeat a key. With ``returning``, the values of those
+    columns after the change are returned, one tuple per row.
+    """
+    insert = insert_for(connection)
+    if insert is not None:
+        stmt = on_conflict_add(insert(table).values(rows), keys, columns, also)
+        if returning:
+            return [tuple(row) for row in connection.execute(stmt.returning(*(table.c[name] for name in returning)))]
+        connection.execute(stmt)
+        return []
+
+    result = []
+    for row in rows:
+        match = [table.c[key] == row[key] for key in keys]
+        values = {name: table.c[name] + row[name] for name in columns}
+        values.update(also or {})
+        if connection.execute(table.update().where(*match).values(values)).rowcount == 0:
+            connection.execute(table.insert().values(**row))
+        if returning:
+            result.append(tuple(connection.execute(select(*(table.c[name] for name in returning)).where(*match)).one()))
+    return result
@@ -0,0 +1,631 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+from sqlalchemy import inspect
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+from app import db, events, loaders, notifications, routing, stats
+from app.models import Task, TaskHistory, User, CXOArticle
+
+# Task routing between sales, editorial and design.
+#
+# Each transition is a list of guards, checked in order, plus an effect that
+# changes the task and describes the history entry and notifications it
+# produces. apply() runs one against a TransitionContext whose task was loaded
+# with everything the guards and effects read, so a transition costs a fixed
+# number of queries: the task, at most one user lookup, and a single flush.
+#
+# Tasks are read without locks. The flush only updates the task version that
+# was read (Task.version), so of two users acting on the same task the second
+# is refused instead of overwriting the first. A transition with a claim (pickup)
+# is written by one conditional UPDATE instead: the open pool changes all the
+# time, and the task only has to still be free, not unchanged.
+
+STATES = ('Open', 'Assigned', 'InProgress', 'Review', 'Completed', 'Archived')
+DEPARTMENTS = ('sales', 'editorial', 'design')
+
+CHANGED_MESSAGE = 'This task was changed by someone else in the meantime. Please check it and try again.'
+
+
+class TransitionError(Exception):
+    def __init__(self, message, category='danger'):
+        super().__init__(message)
+        self.message = message
+        self.category = category
+
+
+class TransitionContext:
+    def __init__(self, task, actor, params=None):
+        self.task = task
+        self.actor = actor
+        self.params = params or {}
+        self.now = datetime.utcnow()
+        self._managers = {}
+        # Work handed to managers by this context and not yet written; see routing.manager_for()
+        self._assigned = Counter()
+        self._users = {}
+
+    @property
+    def comment(self):
+        return (self.params.get('comment') or '').strip()
+
+    def user(self, user_id):
+        if not user_id:
+            return None
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        if user_id not in self._users:
+            self._users[user_id] = db.session.get(User, user_id)
+        return self._users[user_id]
+
+    def manager_of(self, department):
+        # Guards and the effect must agree on the manager they route a task to
+        key = (department, self.task.id if self.task else None)
+        if key not in self._managers:
+            manager = routing.manager_for(department, self._assigned)
+            if manager:
+                self._assigned[manager.id] += 1
+            self._managers[key] = manager
+        return self._managers[key]
+
+
+class Guard:
+    def __init__(self, check, message, category='danger'):
+        self.check = check
+        self.message = message
+        self.category = category
+
+    def __call__(self, ctx):
+        if not self.check(ctx):
+            raise TransitionError(self.message, self.category)
+
+
+class Step:
+    """What a transition did: its history entry, notifications and flash message."""
+
+    def __init__(self, action, message, old_value=None, new_value=None, from_department=None,
+                 to_department=None, comment=None, notify=(), category='success'):
+        self.action = action
+        self.message = message
+        self.old_value = old_value
+        self.new_value = new_value
+        self.from_department = from_department
+        self.to_department = to_department
+        self.comment = comment
+        self.notify = list(notify)
+        self.category = category
+
+
+class Transition:
+    def __init__(self, name, effect, guards=(), targets=(), claim=None, claim_message=None, bulk_guards=()):
+        self.name = name
+        self.effect = effect
+        self.guards = list(guards)
+        # Checked as well when a manager applies it to many tasks at once
+        self.bulk_guards = list(bulk_guards)
+        self.targets = tuple(targets)
+        # {column: value} that must still hold in the database when the change is written
+        self.claim = claim
+        self.claim_message = claim_message or CHANGED_MESSAGE
+
+
+def status_is(*statuses, message, category='warning'):
+    return Guard(lambda ctx: ctx.task.status in statuses, message, category)
+
+
+def not_completed(message):
+    return Guard(lambda ctx: ctx.task.status != 'Completed', message, 'warning')
+
+
+def role_in(*roles, message):
+    return Guard(lambda ctx: ctx.actor.role in roles, message)
+
+
+def assignee_or_manager(message):
+    return Guard(lambda ctx: ctx.task.assigned_to_id == ctx.actor.id or ctx.actor.is_manager, message)
+
+
+def _username(user):
+    return user.username if user else 'Unassigned'
+
+
+def _reassign(ctx):
+    task, actor = ctx.task, ctx.actor
+    new_department = ctx.params.get('department')
+    new_assignee = ctx.user(ctx.params.get('assigned_to'))
+
+    old_department = task.current_department
+    old_assignee = task.assigned_user
+
+    task.assigned_to_id = new_assignee.id if new_assignee else None
+    task.assigned_department = new_department
+    task.current_department = new_department
+
+    if new_department == 'design' and old_department == 'editorial' and not task.original_requester_id:
+        if old_assignee and old_assignee.department == 'editorial':
+            task.original_requester_id = task.assigned_to_id
+        elif actor.department == 'editorial':
+            task.original_requester_id = actor.id
+
+    notify = []
+    if new_assignee:
+        notify.append((new_assignee.id, f'Task reassigned to you by {actor.username} ({new_department.capitalize()} department)'))
+    else:
+        dept_manager = ctx.manager_of(new_department)
+        if dept_manager:
+            task.assigned_to_id = dept_manager.id
+            notify.append((dept_manager.id, f'New task for {new_department.capitalize()} department from {actor.username}'))
+
+    return Step(
+        'Task Reassigned', 'Task reassigned successfully!',
+        old_value=f'{_username(old_assignee)} ({old_department})',
+        new_value=f'{_username(new_assignee)} ({new_department})',
+        from_department=old_department,
+        to_department=new_department,
+        comment=ctx.comment,
+        notify=notify
+    )
+
+
+def _complete(ctx):
+    task, actor = ctx.task, ctx.actor
+    old_status = task.status
+
+    if task.current_department == 'design' and task.original_requester_id and not actor.is_manager:
+        task.status = 'Review'
+        task.assigned_to_id = task.original_requester_id
+        task.assigned_department = 'editorial'
+        task.current_department = 'editorial'
+        return Step(
+            'Design Completed - Returned to Editorial',
+            'Design work completed! Task returned to editorial for review.',
+            old_value=old_status,
+            new_value='Review',
+            from_department='design',
+            to_department='editorial',
+            comment=ctx.comment,
+            notify=[(task.original_requester_id, f'Design work completed by {actor.username}. Task returned for your review.')]
+        )
+
+    task.status = 'Completed'
+    task.completed_at = ctx.now
+    return Step('Task Completed', 'Task marked as completed!', old_value=old_status, new_value='Completed', comment=ctx.comment)
+
+
+def _pickup(ctx):
+    task, actor = ctx.task, ctx.actor
+    task.assigned_to_id = actor.id
+    task.status = 'Assigned'
+    return Step(
+        'Task Picked Up', f'Task #{task.id} picked up successfully!',
+        old_value='Open', new_value='Assigned',
+        comment=f'Task picked up by {actor.username}'
+    )
+
+
+def _ownership_note(old_owner, member):
+    if old_owner:
+        return f' [Owner changed: {old_owner.username} → {member.username}]'
+    return f' [Owner set: {member.username}]'
+
+
+def _assign_to_member(ctx):
+    task, actor = ctx.task, ctx.actor
+    member = ctx.user(ctx.params.get('member_id'))
+    old_assignee = task.assigned_user
+
+    task.assigned_to_id = member.id
+    task.status = 'Assigned'
+
+    ownership_note = ''
+    if task.current_department == 'editorial':
+        ownership_note = _ownership_note(task.editorial_owner, member)
+        task.editorial_owner_id = member.id
+    elif task.current_department == 'design':
+        ownership_note = _ownership_note(task.design_owner, member)
+        task.design_owner_id = member.id
+
+    return Step(
+        'Task Assigned by Manager', f'Task #{task.id} assigned to {member.username}!',
+        old_value=_username(old_assignee),
+        new_value=member.username + ownership_note,
+        comment=f'Manager assigned task to {member.username}',
+        notify=[(member.id, f'Task #{task.id} assigned to you by {actor.username}')]
+    )
+
+
+def _send_back_to_manager(ctx):
+    task, actor = ctx.task, ctx.actor
+    manager = ctx.manager_of(task.current_department)
+    old_assignee = task.assigned_user
+
+    task.assigned_to_id = manager.id
+    task.status = 'Assigned'
+
+    return Step(
+        'Sent Back to Manager', f'Task sent back to {manager.username} for review!',
+        old_value=_username(old_assignee),
+        new_value=manager.username,
+        comment=ctx.comment or f'Sent back to {manager.username} for review',
+        notify=[(manager.id, f'Task #{task.id} sent back to you for review by {actor.username}')]
+    )
+
+
+def _editorial_contact(ctx):
+    task = ctx.task
+    if task.original_requester and task.original_requester.department == 'editorial':
+        return task.original_requester
+    if task.editorial_owner_id:
+        return task.editorial_owner
+    if task.creator and task.creator.department == 'editorial':
+        return task.creator
+    return ctx.manager_of('editorial') or next(iter(routing.members('editorial')), None)
+
+
+def _send_back_to_editor(ctx):
+    task, actor = ctx.task, ctx.actor
+    old_assignee = task.assigned_user
+
+    if task.current_department == 'design':
+        next_user = _editorial_contact(ctx)
+        task.assigned_to_id = next_user.id if next_user else None
+        task.current_department = 'editorial'
+        task.status = 'Assigned' if next_user else 'Open'
+        return Step(
+            'Design Completed - Sent to Editorial',
+            f'Task sent back to {next_user.username if next_user else "editorial"}!',
+            old_value=_username(old_assignee),
+            new_value=_username(next_user),
+            from_department='design',
+            to_department='editorial',
+            comment=ctx.comment or 'Design work completed, sending back to editor',
+            notify=[(next_user.id, f'Task #{task.id} design completed - returned to you by {actor.username}')] if next_user else []
+        )
+
+    next_user = task.design_owner if task.design_owner_id else ctx.manager_of('design')
+    task.assigned_to_id = next_user.id if next_user else None
+    task.current_department = 'design'
+    task.status = 'Assigned' if next_user else 'Open'
+    if not task.original_requester_id:
+        task.original_requester_id = actor.id
+    return Step(
+        'Editorial Completed - Sent to Design',
+        f'Task sent to {next_user.username if next_user else "design team"}!',
+        old_value=_username(old_assignee),
+        new_value=_username(next_user),
+        from_department='editorial',
+        to_department='design',
+        comment=ctx.comment or 'Editorial work completed, sending to design',
+        notify=[(next_user.id, f'Task #{task.id} sent to you for design by {actor.username}')] if next_user else []
+    )
+
+
+def _send_to_sales(ctx):
+    task, actor = ctx.task, ctx.actor
+    sales_person = task.creator
+    old_assignee = task.assigned_user
+
+    task.assigned_to_id = sales_person.id
+    task.assigned_department = 'sales'
+    task.current_department = 'sales'
+    task.status = 'Assigned'
+
+    return Step(
+        'Sent to Sales for Client Feedback', f'Task sent to {sales_person.username} for client feedback!',
+        old_value=_username(old_assignee),
+        new_value=sales_person.username,
+        from_department='editorial',
+        to_department='sales',
+        comment=ctx.comment or 'Sent back to sales for client feedback',
+        notify=[(sales_person.id, f'Task #{task.id} sent back to you for client feedback by {actor.username}')]
+    )
+
+
+def _assign_to_team(ctx):
+    task = ctx.task
+    old_assignee = task.assigned_user
+    old_status = task.status
+
+    task.assigned_to_id = None
+    task.status = 'Open'
+
+    return Step(
+        'Task Assigned to Team', f'Task #{task.id} assigned to {task.current_department} team!',
+        old_value=f'{_username(old_assignee)} ({old_status})',
+        new_value=f'{task.current_department} team (Open)',
+        comment='Task made available to team'
+    )
+
+
+_sends_back = [
+    role_in('editorial', 'design', message='Only editorial and design users can use this option.'),
+    assignee_or_manager('You can only send back tasks that are assigned to you.'),
+]
+
+TRANSITIONS = {t.name: t for t in [
+    Transition('reassign', _reassign, targets=STATES, guards=[
+        Guard(lambda ctx: ctx.actor.role in ('manager', 'super_admin', ctx.task.current_department),
+              'You can only reassign tasks in your department or if you are a manager.'),
+        not_completed('Cannot reassign a completed task.'),
+        Guard(lambda ctx: ctx.params.get('department') in DEPARTMENTS, 'Invalid department selected.'),
+        Guard(lambda ctx: not ctx.params.get('assigned_to') or ctx.user(ctx.params['assigned_to']),
+              'Selected user does not exist.'),
+    ]),
+    Transition('complete', _complete, targets=('Review', 'Completed'), guards=[
+        not_completed('Task is already completed.'),
+    ], bulk_guards=[
+        Guard(lambda ctx: ctx.actor.department == ctx.task.current_department or ctx.actor.role == 'super_admin',
+              'You can only complete tasks in your own department.'),
+    ]),
+    Transition('pickup', _pickup, targets=('Assigned',),
+               claim={'status': 'Open', 'assigned_to_id': None},
+               claim_message='Someone else picked up this task first.', guards=[
+        status_is('Open', message='This task is not available for pickup.'),
+        Guard(lambda ctx: ctx.task.assigned_to_id is None, 'This task is already assigned.', 'warning'),
+        Guard(lambda ctx: ctx.actor.department, 'You must have a department assigned to pick up tasks.'),
+        Guard(lambda ctx: ctx.task.current_department == ctx.actor.department, 'You can only pick up tasks in your department.'),
+    ]),
+    Transition('assign_to_member', _assign_to_member, targets=('Assigned',), guards=[
+        Guard(lambda ctx: ctx.actor.is_manager and ctx.actor.department == ctx.task.current_department,
+              'Only managers can assign tasks to team members.'),
+        status_is('Open', 'Assigned', message='This task cannot be reassigned at this time.'),
+        Guard(lambda ctx: ctx.params.get('member_id'), 'Please select a team member.'),
+        Guard(lambda ctx: ctx.user(ctx.params['member_id']) and ctx.user(ctx.params['member_id']).department == ctx.actor.department,
+              'Invalid team member selected.'),
+    ]),
+    Transition('send_back_to_manager', _send_back_to_manager, targets=('Assigned',), guards=_sends_back + [
+        not_completed('Cannot reassign a completed task.'),
+        Guard(lambda ctx: ctx.manager_of(ctx.task.current_department), 'No manager found for this department.'),
+    ]),
+    Transition('send_back_to_editor', _send_back_to_editor, targets=('Assigned', 'Open'), guards=_sends_back + [
+        not_completed('Task is already completed.'),
+        Guard(lambda ctx: ctx.task.current_department in ('design', 'editorial'), 'Invalid department for this action.'),
+    ]),
+    Transition('send_to_sales', _send_to_sales, targets=('Assigned',), guards=[
+        role_in('editorial', message='Only editorial users can send tasks to sales.'),
+        assignee_or_manager('You can only send back tasks that are assigned to you.'),
+        not_completed('Cannot reassign a completed task.'),
+        Guard(lambda ctx: ctx.task.creator and ctx.task.creator.department == 'sales', 'No sales person found for this task.'),
+    ]),
+    Transition('assign_to_team', _assign_to_team, targets=('Open',), guards=[
+        Guard(lambda ctx: ctx.actor.is_manager or ctx.actor.role == 'super_admin', 'Only managers can assign tasks to the team.'),
+        Guard(lambda ctx: ctx.actor.department == ctx.task.current_department or ctx.actor.role == 'super_admin',
+              'You can only assign tasks to your own department team.'),
+        not_completed('Cannot reassign a completed task.'),
+        Guard(lambda ctx: ctx.task.assigned_to_id is not None,
+              'This task is already assigned to the team (unassigned individual).', 'info'),
+    ]),
+]}
+
+
+def load_task(task_id):
+    return Task.query.options(*loaders.TASK_WORKFLOW).get_or_404(task_id)
+
+
+def _history_row(ctx, step):
+    return {
+        'task_id': ctx.task.id,
+        'user_id': ctx.actor.id,
+        'action': step.action,
+        'old_value': step.old_value,
+        'new_value': step.new_value,
+        'from_department': step.from_department,
+        'to_department': step.to_department,
+        'comment': step.comment,
+        'created_at': ctx.now,
+    }
+
+
+def _notification_rows(ctx, step):
+    return [
+        {'user_id': user_id, 'task_id': ctx.task.id, 'message': message, 'created_at': ctx.now}
+        for user_id, message in step.notify
+    ]
+
+
+def _changed_columns(task):
+    state = inspect(task)
+    return {
+        attr.key: getattr(task, attr.key) for attr in inspect(Task).column_attrs
+        if state.attrs[attr.key].history.has_changes()
+    }
+
+
+def _check_version(ctx):
+    # Forms carry the version the user was looking at; refuse to act on a task they haven't seen
+    expected = ctx.params.get('version')
+    if expected and str(expected) != str(ctx.task.version):
+        raise TransitionError(CHANGED_MESSAGE, 'warning')
+
+
+def _write_claimed(transition, ctx, before, old_assignee_id):
+    """Write the change with one UPDATE that only matches while the claim still holds.
+
+    Whoever's UPDATE comes second matches no row and gets the claim message;
+    the row lock taken by the first makes the second re-check the condition
+    against the committed row rather than the one it read.
+    """
+    task = ctx.task
+    conditions = [
+        getattr(Task, key).is_(None) if value is None else getattr(Task, key) == value
+        for key, value in transition.claim.items()
+    ]
+    changes = _changed_columns(task)
+    # An autoflush here would write the change through the ORM, unconditionally
+    with db.session.no_autoflush:
+        version = db.session.execute(
+            db.update(Task).where(Task.id == task.id, *conditions)
+            .values({**changes, 'version': Task.version + 1})
+            .returning(Task.version)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+    if version is None:
+        # Drop the in-memory change so nothing flushes it
+        db.session.expire(task)
+        raise TransitionError(transition.claim_message, 'warning')
+
+    # The row is written; record the new values as loaded so the flush leaves the task alone
+    for key, value in changes.items():
+        set_committed_value(task, key, value)
+    set_committed_value(task, 'version', version)
+
+    deltas = defaultdict(int)
+    stats.add_delta(deltas, before, -1)
+    stats.add_delta(deltas, stats.tracked_values(task), 1)
+    deltas = {bucket: change for bucket, change in deltas.items() if change}
+    if deltas:
+        stats.apply_deltas(db.session.connection(), deltas)
+    events.task_changed(task, old_assignee_id, before['current_department'])
+
+
+def _check_and_apply(transition, ctx, bulk=False):
+    # Lookups made by guards and effects must not flush the half-applied change
+    with db.session.no_autoflush:
+        for guard in transition.guards + (transition.bulk_guards if bulk else []):
+            guard(ctx)
+        step = transition.effect(ctx)
+    task = ctx.task
+    if task.status not in transition.targets:
+        raise RuntimeError(f'{transition.name} left task #{task.id} in undeclared state {task.status!r}')
+    task.updated_at = ctx.now
+    return step
+
+
+def apply(name, ctx):
+    """Check and apply a transition in the session. Returns its Step.
+
+    Only a transition with a claim writes the task here; the rest wait for the flush.
+    """
+    transition = TRANSITIONS[name]
+    if transition.claim:
+        before = stats.tracked_values(ctx.task)
+        old_assignee_id = ctx.task.assigned_to_id
+        step = _check_and_apply(transition, ctx)
+        _write_claimed(transition, ctx, before, old_assignee_id)
+    else:
+        _check_version(ctx)
+        step = _check_and_apply(transition, ctx)
+
+    db.session.add(TaskHistory(**_history_row(ctx, step)))
+    for user_id, message in step.notify:
+        notifications.notify(user_id, message, ctx.task.id)
+
+    if ctx.task.cxo_article:
+        ctx.task.cxo_article.sync_with_task()
+    return step
+
+
+def run(name, task, actor, params=None):
+    """Apply a transition and commit it."""
+    try:
+        step = apply(name, TransitionContext(task, actor, params))
+        db.session.commit()
+    except StaleDataError:
+        # Someone else's change to the task committed after we read it
+        db.session.rollback()
+        raise TransitionError(CHANGED_MESSAGE, 'warning')
+    return step
+
+
+# Transitions managers may apply to many tasks at once
+BULK_TRANSITIONS = ('assign_to_member', 'assign_to_team', 'reassign', 'complete')
+
+# Rows per multi-row INSERT when writing bulk history
+INSERT_BATCH_SIZE = 500
+
+
+class BulkResult:
+    def __init__(self):
+        self.updated = []
+        self.errors = {}
+
+
+def _insert_rows(model, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(db.insert(model).values(rows[start:start + INSERT_BATCH_SIZE]))
+
+
+def apply_bulk(name, task_ids, actor, params=None):
+    """Apply one transition to many tasks with set-based writes, without committing.
+
+    Guards run per task; tasks that fail one are left untouched and reported
+    in BulkResult.errors as {task_id: message}. Tasks that pass are written
+    with one UPDATE per distinct set of new values, multi-row INSERTs for
+    history and notifications, and one CXO article resync. Like a single
+    transition, the UPDATE only matches the task version that was read.
+    """
+    transition = TRANSITIONS[name]
+    result = BulkResult()
+    task_ids = list(dict.fromkeys(task_ids))
+    # Lock the rows so the guards see what the UPDATEs will overwrite
+    tasks = {
+        task.id: task for task in
+        Task.query.options(*loaders.TASK_WORKFLOW).filter(Task.id.in_(task_ids)).with_for_update(of=Task)
+    }
+
+    ctx = TransitionContext(None, actor, params)
+    updates = defaultdict(list)
+    applied = []
+
+    for task_id in task_ids:
+        task = tasks.get(task_id)
+        if task is None:
+            result.errors[task_id] = 'Task not found.'
+            continue
+        ctx.task = task
+        before = stats.tracked_values(task)
+        old_assignee_id = task.assigned_to_id
+        try:
+            step = _check_and_apply(transition, ctx, bulk=True)
+        except TransitionError as error:
+            result.errors[task_id] = error.message
+            continue
+
+        changes = tuple(sorted(_changed_columns(task).items()))
+        updates[changes].append((task_id, task.version))
+        applied.append((task, step, ctx.now, before, old_assignee_id))
+
+    written = set()
+    # The changes are still only in memory; an autoflush would write them unconditionally
+    with db.session.no_autoflush:
+        for changes, versions in updates.items():
+            written.update(db.session.execute(
+                db.update(Task).where(db.tuple_(Task.id, Task.version).in_(versions))
+                .values({**dict(changes), 'version': Task.version + 1})
+                .returning(Task.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+
+        deltas = defaultdict(int)
+        history, notices = [], []
+        for task, step, now, before, old_assignee_id in applied:
+            if task.id not in written:
+                result.errors[task.id] = CHANGED_MESSAGE
+            else:
+                ctx.task, ctx.now = task, now
+                stats.add_delta(deltas, before, -1)
+                stats.add_delta(deltas, stats.tracked_values(task), 1)
+                history.append(_history_row(ctx, step))
+                notices.extend(_notification_rows(ctx, step))
+                events.task_changed(task, old_assignee_id, before['current_department'])
+                result.updated.append(task.id)
+            # Written by the UPDATEs above or refused; either way the flush must not repeat it
+            db.session.expire(task)
+
+    _insert_rows(TaskHistory, history)
+    notifications.notify_many(notices)
+
+    deltas = {bucket: change for bucket, change in deltas.items() if change}
+    if deltas:
+        stats.apply_deltas(db.session.connection(), deltas)
+    if result.updated:
+        CXOArticle.sync_all_with_tasks(result.updated)
+    return result
+
+
+def run_bulk(name, task_ids, actor, params=None):
+    """apply_bulk() and commit."""
+    result = apply_bulk(name, task_ids, actor, params)
+    db.session.commit()
+    return result
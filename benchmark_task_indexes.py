@@ -0,0 +1,187 @@
+"""Show query plans and timings for the hot task list queries.
+
+Usage:
+    python benchmark_task_indexes.py                  # plans + timings with current indexes
+    python benchmark_task_indexes.py --seed 200000    # add synthetic tasks first
+    python benchmark_task_indexes.py --compare        # drop the task indexes, measure, recreate, measure
+
+--compare drops and recreates indexes, so point DATABASE_URL at a scratch database.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, insert, text
+
+from app import create_app, db
+from app.models import User, Brand, Edition, Task
+
+STATUSES = ['Open', 'Assigned', 'InProgress', 'Review', 'Completed']
+DEPARTMENTS = ['sales', 'editorial', 'design']
+PRIORITIES = ['normal', 'high', 'urgent']
+
+
+def seed_tasks(count):
+    users = User.query.all()
+    if not users:
+        user = User(replit_user_id='bench_user', username='bench_user', role='design', department='design')
+        db.session.add(user)
+        db.session.flush()
+        users = [user]
+
+    brand = Brand.query.filter_by(name='Benchmark Brand').first()
+    if not brand:
+        brand = Brand(name='Benchmark Brand')
+        db.session.add(brand)
+        db.session.flush()
+        for month in range(1, 13):
+            db.session.add(Edition(brand_id=brand.id, name=f'Bench {month}', year=2025, month=month))
+        db.session.flush()
+    edition_ids = [e.id for e in Edition.query.with_entities(Edition.id).filter_by(brand_id=brand.id)]
+
+    user_ids = [u.id for u in users]
+    now = datetime.utcnow()
+    batch = []
+    for i in range(count):
+        status = random.choice(STATUSES)
+        department = random.choice(DEPARTMENTS)
+        batch.append({
+            'brand_id': brand.id,
+            'edition_id': random.choice(edition_ids),
+            'created_by_id': random.choice(user_ids),
+            'assigned_to_id': None if status == 'Open' and random.random() < 0.8 else random.choice(user_ids),
+            'assigned_department': department,
+            'current_department': department,
+            'company_name': f'Bench Co {i}',
+            'description': f'Synthetic benchmark task {i}',
+            'priority': random.choice(PRIORITIES),
+            'status': status,
+            'is_archived': random.random() < 0.3,
+            'created_at': now - timedelta(minutes=i),
+            'updated_at': now - timedelta(minutes=i),
+        })
+        if len(batch) == 5000:
+            db.session.execute(insert(Task), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Task), batch)
+    db.session.commit()
+    print(f"Seeded {count} synthetic tasks")
+
+
+def hot_queries():
+    user_id = db.session.scalar(select(Task.assigned_to_id).where(Task.assigned_to_id.isnot(None)).limit(1)) or 1
+    edition_id = db.session.scalar(select(Task.edition_id).where(Task.edition_id.isnot(None)).limit(1)) or 1
+    brand_id = db.session.scalar(select(Task.brand_id).where(Task.brand_id.isnot(None)).limit(1)) or 1
+
+    return [
+        ('dashboard to-do', select(Task).where(
+            Task.assigned_to_id == user_id,
+            Task.status.in_(['Assigned', 'InProgress', 'Review', 'Open'])
+        ).order_by(Task.created_at.desc()).limit(5)),
+        ('my_tasks', select(Task).where(Task.assigned_to_id == user_id, Task.status == 'Assigned')),
+        ('manager dept tasks', select(Task).where(
+            Task.assigned_department == 'design',
+            Task.is_archived == False,
+            Task.status.notin_(['Completed', 'Archived'])
+        ).order_by(Task.created_at.desc())),
+        ('department open pool', select(Task).where(
+            Task.assigned_department == 'design',
+            Task.assigned_to_id.is_(None),
+            Task.status == 'Open',
+            Task.is_archived == False
+        ).order_by(Task.created_at.desc())),
+        ('open_tasks page', select(Task).where(
+            Task.status == 'Open',
+            Task.assigned_to_id.is_(None),
+            Task.current_department == 'editorial'
+        ).order_by(Task.created_at.desc())),
+        ('current department status', select(func.count()).select_from(Task).where(
+            Task.current_department == 'design',
+            Task.status == 'Assigned'
+        )),
+        ('edition progress', select(func.count()).select_from(Task).where(
+            Task.edition_id == edition_id,
+            Task.status == 'Completed'
+        )),
+        ('brand task count', select(func.count()).select_from(Task).where(Task.brand_id == brand_id)),
+        ('all_tasks newest page', select(Task).order_by(Task.created_at.desc(), Task.id.desc()).limit(50)),
+    ]
+
+
+def explain(stmt):
+    sql = str(stmt.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(text(f'EXPLAIN (ANALYZE, BUFFERS) {sql}')).all()
+        return [row[0] for row in rows]
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    return [row[-1] for row in rows]
+
+
+def run_queries(label, repeat):
+    print(f"\n=== {label} ===")
+    results = {}
+    for name, stmt in hot_queries():
+        db.session.execute(stmt).all()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            db.session.execute(stmt).all()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+        results[name] = elapsed_ms
+
+        print(f"\n{name}: {elapsed_ms:.2f} ms")
+        for line in explain(stmt):
+            print(f"    {line}")
+    return results
+
+
+def task_indexes():
+    return [index for index in Task.__table__.indexes if index.name.startswith('ix_tasks_')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='insert this many synthetic tasks first')
+    parser.add_argument('--repeat', type=int, default=20, help='executions per query when timing')
+    parser.add_argument('--compare', action='store_true', help='measure without the task indexes, then with them')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.seed:
+            seed_tasks(args.seed)
+
+        print(f"Database: {db.engine.dialect.name}, tasks: {db.session.scalar(select(func.count()).select_from(Task))}")
+
+        if not args.compare:
+            run_queries('Current indexes', args.repeat)
+            return
+
+        indexes = task_indexes()
+        db.session.commit()
+        for index in indexes:
+            index.drop(db.engine, checkfirst=True)
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text('ANALYZE tasks'))
+        before = run_queries('Before (no task indexes)', args.repeat)
+
+        db.session.commit()
+        for index in indexes:
+            index.create(db.engine, checkfirst=True)
+        db.session.execute(text('ANALYZE tasks'))
+        after = run_queries('After (task indexes)', args.repeat)
+
+        print("\n=== Summary (ms per query) ===")
+        print(f"{'query':<30} {'before':>10} {'after':>10} {'speedup':>9}")
+        for name in before:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            print(f"{name:<30} {before[name]:>10.2f} {after[name]:>10.2f} {speedup:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Micro-benchmark of task workflow transitions (app/workflow.py).
+
+Usage:
+    python benchmark_workflow.py                 # 200 tasks through the full routing cycle
+    python benchmark_workflow.py --tasks 2000
+    python benchmark_workflow.py --bulk          # also time the bulk manager endpoint path
+
+Runs against a throwaway in-memory SQLite database. Every task is walked
+through all eight transitions; each one is loaded and committed on its own, as
+a request would. Prints transitions per second and the queries each transition
+issued, which should be the same for every task. --bulk then reopens the tasks
+and moves them all at once through workflow.run_bulk().
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import argparse
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+
+from app import create_app, db, routing, workflow
+from app.models import User, Brand, Edition, Task
+from config import Config
+
+# (transition, acting user, form params) in the order a task goes through them
+CYCLE = [
+    ('pickup', 'editor', {}),
+    ('send_back_to_editor', 'editor', {'comment': 'ready for design'}),
+    ('assign_to_member', 'design_manager', {'member_id': 'designer'}),
+    ('complete', 'designer', {'comment': 'layout done'}),
+    ('send_to_sales', 'editor', {}),
+    ('reassign', 'super_admin', {'department': 'editorial'}),
+    ('assign_to_team', 'editorial_manager', {}),
+    ('complete', 'super_admin', {}),
+]
+
+# Applied to every task at once by --bulk, as a manager closing an edition would
+BULK_CYCLE = [
+    ('reassign', 'super_admin', {'department': 'editorial'}),
+    ('assign_to_member', 'editorial_manager', {'member_id': 'editor'}),
+    ('assign_to_team', 'editorial_manager', {}),
+]
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def seed(count):
+    db.create_all()
+    users = {
+        'super_admin': User(replit_user_id='super_admin', username='super_admin', role='super_admin', department='admin', is_manager=True),
+        'sales': User(replit_user_id='sales', username='sales', role='sales', department='sales'),
+        'editorial_manager': User(replit_user_id='editorial_manager', username='editorial_manager', role='editorial', department='editorial', is_manager=True),
+        'editor': User(replit_user_id='editor', username='editor', role='editorial', department='editorial'),
+        'design_manager': User(replit_user_id='design_manager', username='design_manager', role='design', department='design', is_manager=True),
+        'designer': User(replit_user_id='designer', username='designer', role='design', department='design'),
+    }
+    db.session.add_all(users.values())
+    edition = Edition(brand=Brand(name='Benchmark Brand'), name='Benchmark Edition')
+    db.session.add(edition)
+    db.session.flush()
+
+    for i in range(count):
+        db.session.add(Task(
+            brand_id=edition.brand_id,
+            edition_id=edition.id,
+            created_by_id=users['sales'].id,
+            assigned_department='editorial',
+            current_department='editorial',
+            status='Open',
+            company_name=f'Bench Co {i}',
+            description='Workflow benchmark task'
+        ))
+    db.session.commit()
+    return {name: user.id for name, user in users.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=200, help='tasks to walk through the cycle')
+    parser.add_argument('--bulk', action='store_true', help='then move all tasks at once with run_bulk()')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        user_ids = seed(args.tasks)
+        task_ids = [task_id for (task_id,) in db.session.query(Task.id).order_by(Task.id)]
+        # Build the routing directory up front, as a running worker would have it
+        routing.directory()
+
+        counter = {'queries': 0}
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*_args, **_kwargs):
+            counter['queries'] += 1
+
+        elapsed = defaultdict(float)
+        queries = defaultdict(set)
+        started = time.perf_counter()
+        for task_id in task_ids:
+            for name, actor, params in CYCLE:
+                params = {key: str(user_ids[value]) if key == 'member_id' else value for key, value in params.items()}
+                db.session.remove()
+                counter['queries'] = 0
+                t0 = time.perf_counter()
+                actor = db.session.get(User, user_ids[actor])
+                workflow.run(name, workflow.load_task(task_id), actor, params)
+                elapsed[name] += time.perf_counter() - t0
+                queries[name].add(counter['queries'])
+        total = time.perf_counter() - started
+
+        transitions = len(task_ids) * len(CYCLE)
+        print(f"{'transition':<22} {'mean ms':>8} {'queries':>8}")
+        for name in dict.fromkeys(name for name, _, _ in CYCLE):
+            runs = len(task_ids) * sum(1 for n, _, _ in CYCLE if n == name)
+            counts = '/'.join(str(q) for q in sorted(queries[name]))
+            print(f'{name:<22} {elapsed[name] / runs * 1000:>8.2f} {counts:>8}')
+        print(f'\n{transitions} transitions in {total:.2f}s: {transitions / total:,.0f} transitions/s')
+
+        final = {status for (status,) in db.session.query(Task.status).distinct()}
+        if final != {'Completed'}:
+            print(f'Unexpected final task states: {sorted(final)}')
+            sys.exit(1)
+
+        if args.bulk:
+            bulk_benchmark(task_ids, user_ids, counter)
+
+
+def bulk_benchmark(task_ids, user_ids, counter):
+    # Completed tasks can't be reassigned, so reopen them first
+    db.session.query(Task).update({Task.status: 'Assigned'})
+    db.session.commit()
+
+    print(f"\n{'bulk transition':<22} {'tasks/s':>10} {'queries':>8}")
+    for name, actor, params in BULK_CYCLE:
+        params = {key: str(user_ids[value]) if key == 'member_id' else value for key, value in params.items()}
+        db.session.remove()
+        counter['queries'] = 0
+        t0 = time.perf_counter()
+        result = workflow.run_bulk(name, task_ids, db.session.get(User, user_ids[actor]), params)
+        elapsed = time.perf_counter() - t0
+        if result.errors:
+            print(f'{name}: {len(result.errors)} tasks refused, e.g. {next(iter(result.errors.values()))}')
+            sys.exit(1)
+        print(f"{name:<22} {len(result.updated) / elapsed:>10,.0f} {counter['queries']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Fail if a list view's query count exceeds its budget or grows with row count.
+
+Usage:
+    python check_query_budget.py
+
+Runs against a throwaway in-memory SQLite database. Every seeded task gets its
+own brand, edition and users, and the design team grows with it, so anything
+that is lazy-loaded or counted per row or per team member shows up as extra
+queries on the larger data set. Exits non-zero on failure.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Brand, Edition, Task, CXOArticle
+from config import Config
+
+ROW_COUNTS = [5, 60]
+
+# (label, login as, url, max queries)
+VIEWS = [
+    ('all tasks', 'design_manager', '/tasks/', 6),
+    ('all tasks search', 'design_manager', '/tasks/?search=company', 7),
+    ('my tasks', 'designer', '/tasks/my-tasks', 5),
+    ('open tasks', 'designer', '/tasks/open-tasks', 6),
+    ('dashboard', 'designer', '/dashboard', 8),
+    ('manager dashboard', 'design_manager', '/manager-dashboard', 7),
+    ('edition detail', 'design_manager', '/magazines/edition/1', 5),
+    ('magazines', 'design_manager', '/magazines/', 6),
+    ('cxo articles', 'super_admin', '/cxo/articles', 6),
+    ('cxo dashboard', 'cxo', '/cxo-dashboard', 6),
+]
+
+
+class BudgetConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    TESTING = True
+
+
+def seed(count):
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+    staff = {
+        'super_admin': User(replit_user_id='super_admin', username='super_admin', role='super_admin', department='admin', is_manager=True),
+        'cxo': User(replit_user_id='cxo', username='cxo', role='cxo', department='executive', is_manager=True),
+        'design_manager': User(replit_user_id='design_manager', username='design_manager', role='design', department='design', is_manager=True),
+        'designer': User(replit_user_id='designer', username='designer', role='design', department='design'),
+    }
+    db.session.add_all(staff.values())
+    shared_edition = Edition(brand=Brand(name='Shared Brand'), name='Shared Edition')
+    db.session.add(shared_edition)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    for i in range(count):
+        brand = Brand(name=f'Brand {i}')
+        edition = Edition(brand=brand, name=f'Edition {i}')
+        creator = User(replit_user_id=f'sales_{i}', username=f'sales_{i}', role='sales', department='sales')
+        teammate = User(replit_user_id=f'designer_{i}', username=f'designer_{i}', role='design', department='design')
+        db.session.add_all([brand, edition, creator, teammate])
+        db.session.flush()
+
+        assignee = None
+        if i % 4 == 1:
+            assignee = staff['designer']
+        elif i % 4 == 3:
+            assignee = teammate
+        db.session.add(Task(
+            brand_id=brand.id,
+            edition_id=shared_edition.id if i % 3 == 0 else edition.id,
+            created_by_id=creator.id,
+            original_requester_id=creator.id,
+            assigned_to_id=assignee.id if assignee else None,
+            assigned_department='design',
+            current_department='design',
+            status='Assigned' if assignee else 'Open',
+            company_name=f'Company {i}',
+            description=f'Task description {i}',
+            deadline=now + timedelta(days=i + 1),
+            created_at=now - timedelta(minutes=i)
+        ))
+        db.session.add(CXOArticle(
+            brand_id=brand.id,
+            edition_id=edition.id,
+            uploaded_by_id=creator.id if i % 2 else staff['cxo'].id,
+            assigned_to_id=staff['design_manager'].id,
+            company_name=f'Company {i}',
+            status='Pending'
+        ))
+    db.session.commit()
+    return {name: user.id for name, user in staff.items()}
+
+
+def measure(app, client, user_ids, counter):
+    results = {}
+    for label, username, url, _ in VIEWS:
+        with client.session_transaction() as sess:
+            sess.clear()
+            sess['user_id'] = user_ids[username]
+        db.session.remove()
+        counter['queries'] = 0
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} returned {response.status_code}')
+        results[label] = counter['queries']
+    return results
+
+
+def main():
+    app = create_app(BudgetConfig)
+    client = app.test_client()
+    counter = {'queries': 0}
+
+    measurements = []
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*args, **kwargs):
+            counter['queries'] += 1
+
+        for count in ROW_COUNTS:
+            user_ids = seed(count)
+            measurements.append(measure(app, client, user_ids, counter))
+
+    failures = []
+    print(f"{'view':<22} " + ' '.join(f'{n:>6} rows' for n in ROW_COUNTS) + '   budget')
+    for label, _, _, budget in VIEWS:
+        counts = [m[label] for m in measurements]
+        status = 'ok'
+        if max(counts) > budget:
+            status = 'OVER BUDGET'
+        elif len(set(counts)) > 1:
+            status = 'GROWS WITH ROWS'
+        if status != 'ok':
+            failures.append(label)
+        print(f"{label:<22} " + ' '.join(f'{c:>11}' for c in counts) + f'   {budget:>6}  {status}')
+
+    if failures:
+        print(f"\nFAILED: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nAll list views within their query budget.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
-from app import create_app, db
-from app.models import Task, TaskHistory, TaskFile, User, Brand, Edition, Notification, CXOArticle
+from app import create_app, db, notifications, blobs
+from app.models import Task, TaskHistory, TaskFile, User, Brand, Edition, Notification, NotificationBroadcast, NotificationReceipt, CXOArticle, BrandStats, EditionStats
 from datetime import datetime, timedelta
 
 app = create_app()
@@ -13,12 +13,21 @@ def clear_all_tasks():
         
         if task_ids:
             Notification.query.filter(Notification.task_id.in_(task_ids)).delete(synchronize_session=False)
+            broadcast_ids = db.session.query(NotificationBroadcast.id).filter(NotificationBroadcast.task_id.in_(task_ids))
+            NotificationReceipt.query.filter(NotificationReceipt.broadcast_id.in_(broadcast_ids)).delete(synchronize_session=False)
+            NotificationBroadcast.query.filter(NotificationBroadcast.task_id.in_(task_ids)).delete(synchronize_session=False)
             CXOArticle.query.filter(CXOArticle.task_id.in_(task_ids)).delete(synchronize_session=False)
         
         TaskFile.query.delete()
         TaskHistory.query.delete()
+        BrandStats.query.delete()
+        EditionStats.query.delete()
         Task.query.delete()
         db.session.commit()
+        # Task notifications were bulk-deleted behind the unread counters' back
+        notifications.recount()
+        # And task files behind the blob reference counts'
+        blobs.recount()
         print("✓ All tasks cleared!")
 
 def seed_sample_tasks():
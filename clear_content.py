@@ -12,10 +12,11 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from app import create_app, db
+from app import create_app, db, blobs
 from app.models import (
     User, Brand, Edition, Task, TaskHistory, TaskFile, 
-    CXOArticle, Ad, Notification
+    CXOArticle, Ad, Notification, NotificationBroadcast, NotificationReceipt,
+    NotificationCounter, NotificationArchive, BrandStats, EditionStats
 )
 
 def clear_tasks_only():
@@ -35,6 +36,7 @@ def clear_tasks_only():
         print(f"  CXO Articles: {CXOArticle.query.count()}")
         print(f"  Ads: {Ad.query.count()}")
         print(f"  Notifications: {Notification.query.count()}")
+        print(f"  Notification Broadcasts: {NotificationBroadcast.query.count()}")
         print("")
         print("Will be preserved:")
         print(f"  Users: {User.query.count()}")
@@ -54,6 +56,14 @@ def clear_tasks_only():
         
         print("  Deleting notifications...")
         deleted_counts['Notifications'] = Notification.query.delete()
+        NotificationReceipt.query.delete()
+        NotificationCounter.query.delete()
+        NotificationArchive.query.delete()
+        deleted_counts['Notification Broadcasts'] = NotificationBroadcast.query.delete()
+        
+        print("  Deleting task rollups...")
+        BrandStats.query.delete()
+        EditionStats.query.delete()
         
         print("  Deleting tasks...")
         deleted_counts['Tasks'] = Task.query.delete()
@@ -66,6 +76,8 @@ def clear_tasks_only():
         
         # Commit the changes
         db.session.commit()
+        # Files were bulk-deleted behind the blob reference counts' back
+        blobs.recount()
         
         print("")
         print("=" * 80)
@@ -106,6 +118,7 @@ def clear_all_content():
         print(f"  CXO Articles: {CXOArticle.query.count()}")
         print(f"  Ads: {Ad.query.count()}")
         print(f"  Notifications: {Notification.query.count()}")
+        print(f"  Notification Broadcasts: {NotificationBroadcast.query.count()}")
         print("")
         
         print("⚠️  WARNING: This will delete ALL brands and editions!")
@@ -126,6 +139,14 @@ def clear_all_content():
         
         print("  Deleting notifications...")
         deleted_counts['Notifications'] = Notification.query.delete()
+        NotificationReceipt.query.delete()
+        NotificationCounter.query.delete()
+        NotificationArchive.query.delete()
+        deleted_counts['Notification Broadcasts'] = NotificationBroadcast.query.delete()
+        
+        print("  Deleting task rollups...")
+        BrandStats.query.delete()
+        EditionStats.query.delete()
         
         print("  Deleting tasks...")
         deleted_counts['Tasks'] = Task.query.delete()
@@ -144,6 +165,8 @@ def clear_all_content():
         
         # Commit the changes
         db.session.commit()
+        # Files were bulk-deleted behind the blob reference counts' back
+        blobs.recount()
         
         print("")
         print("=" * 80)
@@ -8,6 +8,46 @@ class Config:
     
     UPLOAD_FOLDER = 'app/static/uploads'
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024
+    # Resumable chunked uploads (/uploads): where part files are assembled, the chunk size
+    # clients are told to use (keep it well under MAX_CONTENT_LENGTH) and the largest file accepted
+    UPLOAD_INCOMING_FOLDER = os.environ.get('UPLOAD_INCOMING_FOLDER', 'uploads/incoming')
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+    # `flask uploads prune`: chunked uploads untouched for this many hours are removed
+    CHUNKED_UPLOAD_EXPIRY_HOURS = int(os.environ.get('CHUNKED_UPLOAD_EXPIRY_HOURS', 24))
+    # Content-addressed store every uploaded file is kept in, one file per distinct SHA-256
+    BLOB_FOLDER = os.environ.get('BLOB_FOLDER', 'app/static/uploads/blobs')
+    # Who sends download bytes after the permission check: '' (Flask), 'x-accel' (nginx
+    # X-Accel-Redirect) or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '')
+    # With 'x-accel': the nginx internal location that aliases UPLOAD_FOLDER
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/_uploads/')
+    # Thumbnails and first-page PDF previews of ads and task files, made after upload
+    PREVIEW_FOLDER = os.environ.get('PREVIEW_FOLDER', 'app/static/uploads/previews')
+    # Processes rendering previews beside each app process; 0 leaves it to `flask previews generate`
+    PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 1))
+    # Longest side of a preview in pixels, and seconds browsers may keep one (it never changes)
+    PREVIEW_SIZE = int(os.environ.get('PREVIEW_SIZE', 480))
+    PREVIEW_MAX_AGE = int(os.environ.get('PREVIEW_MAX_AGE', 365 * 24 * 3600))
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'txt', 'mp3', 'wav', 'mp4'}
     
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
+    # Seconds the role claims in the session cookie are trusted before the user is reloaded
+    AUTH_CLAIMS_MAX_AGE = int(os.environ.get('AUTH_CLAIMS_MAX_AGE', 300))
+    # How team-wide notifications are stored: 'rows' (one per member) or 'broadcast' (one row, read receipts per member)
+    NOTIFICATION_TEAM_MODE = os.environ.get('NOTIFICATION_TEAM_MODE', 'rows')
+    # Repeat alerts about the same task within this many seconds update the user's unread one (0 disables)
+    NOTIFICATION_COALESCE_SECONDS = int(os.environ.get('NOTIFICATION_COALESCE_SECONDS', 600))
+    # `flask notifications prune`: read notifications older than this many days are archived or deleted
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+    # Which manager gets new department work when there are several: 'first', 'round_robin' or 'least_loaded'
+    ROUTING_MANAGER_SELECTION = os.environ.get('ROUTING_MANAGER_SELECTION', 'first')
+
+    # Live event delivery: 'inprocess' for a single process, 'postgres' (LISTEN/NOTIFY) across workers;
+    # empty picks 'postgres' when the database is Postgres, where the app runs under several gunicorn workers
+    EVENT_BUS = os.environ.get('EVENT_BUS', '')
+    # Open event streams allowed per process; keep below gunicorn's --threads with gthread workers
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 8))
+    SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+    # Streams end after this long and the browser reconnects, so no connection holds a worker indefinitely
+    SSE_STREAM_SECONDS = int(os.environ.get('SSE_STREAM_SECONDS', 300))
@@ -0,0 +1,14 @@
+# Gunicorn settings: gunicorn -c gunicorn.conf.py main:app
+#
+# gthread workers serve each request on a thread, so an open event stream
+# (/events/stream) holds one thread rather than a whole worker process.
+# Keep SSE_MAX_STREAMS below `threads` so ordinary requests always have room.
+# For many concurrent streams, install gevent and set GUNICORN_WORKER_CLASS=gevent
+# (and raise SSE_MAX_STREAMS accordingly).
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = 120
@@ -0,0 +1,59 @@
+"""Add per-user unread notification counters and a partial unread index
+
+Revision ID: 0b7e4d2a9c15
+Revises: f3c61a8e2d57
+Create Date: 2025-11-26 16:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0b7e4d2a9c15'
+down_revision = 'f3c61a8e2d57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill personal unread rows plus unread team broadcasts; `flask notifications recount` does the same
+    op.execute("""
+        INSERT INTO notification_counters (user_id, unread_count, version)
+        SELECT user_id, sum(unread), 1 FROM (
+            SELECT user_id, count(*) AS unread
+            FROM notifications WHERE is_read = false
+            GROUP BY user_id
+            UNION ALL
+            SELECT users.id, count(*)
+            FROM users JOIN notification_broadcasts b ON b.team = users.role
+            WHERE (users.created_at IS NULL OR b.created_at >= users.created_at)
+              AND NOT EXISTS (
+                  SELECT 1 FROM notification_receipts r
+                  WHERE r.broadcast_id = b.id AND r.user_id = users.id
+              )
+            GROUP BY users.id
+        ) unread_counts
+        GROUP BY user_id
+    """)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index('ix_notifications_user_unread', 'notifications', ['user_id', 'created_at'],
+                            postgresql_where=sa.text('is_read = false'),
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index('ix_notifications_user_unread', 'notifications', ['user_id', 'created_at'],
+                        sqlite_where=sa.text('is_read = 0'))
+
+
+def downgrade():
+    op.drop_index('ix_notifications_user_unread', table_name='notifications')
+    op.drop_table('notification_counters')
@@ -0,0 +1,55 @@
+"""Add composite and partial indexes for task list queries
+
+Revision ID: 3f1a9c2d7b40
+Revises: add_password_column
+Create Date: 2025-11-24 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '3f1a9c2d7b40'
+down_revision = 'add_password_column'
+branch_labels = None
+depends_on = None
+
+
+# (name, columns, partial predicate for postgres, partial predicate for sqlite)
+TASK_INDEXES = [
+    ('ix_tasks_assigned_to_status', ['assigned_to_id', 'status'], None, None),
+    ('ix_tasks_dept_assignee_status_live', ['assigned_department', 'assigned_to_id', 'status'],
+     'is_archived = false', 'is_archived = 0'),
+    ('ix_tasks_current_dept_status', ['current_department', 'status'], None, None),
+    ('ix_tasks_open_pool', ['current_department', 'created_at'],
+     "status = 'Open' AND assigned_to_id IS NULL", "status = 'Open' AND assigned_to_id IS NULL"),
+    ('ix_tasks_edition_status', ['edition_id', 'status'], None, None),
+    ('ix_tasks_brand_id', ['brand_id'], None, None),
+    ('ix_tasks_created_at_id', ['created_at', 'id'], None, None),
+]
+
+
+def upgrade():
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+
+    if is_postgres:
+        # Build without blocking writes on the tasks table
+        with op.get_context().autocommit_block():
+            for name, columns, pg_where, _ in TASK_INDEXES:
+                op.create_index(
+                    name, 'tasks', columns,
+                    postgresql_where=sa.text(pg_where) if pg_where else None,
+                    postgresql_concurrently=True,
+                    if_not_exists=True
+                )
+    else:
+        for name, columns, _, sqlite_where in TASK_INDEXES:
+            op.create_index(
+                name, 'tasks', columns,
+                sqlite_where=sa.text(sqlite_where) if sqlite_where else None
+            )
+
+
+def downgrade():
+    for name, _, _, _ in reversed(TASK_INDEXES):
+        op.drop_index(name, table_name='tasks')
@@ -0,0 +1,43 @@
+"""Add notifications archive and a read-notification retention index
+
+Revision ID: 5d2f8b6c1e03
+Revises: 0b7e4d2a9c15
+Create Date: 2025-11-27 10:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '5d2f8b6c1e03'
+down_revision = '0b7e4d2a9c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notifications_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('task_id', sa.Integer(), nullable=True),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notifications_archive_user_id', 'notifications_archive', ['user_id'])
+
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index('ix_notifications_read_created_at', 'notifications', ['created_at'],
+                            postgresql_where=sa.text('is_read = true'),
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index('ix_notifications_read_created_at', 'notifications', ['created_at'],
+                        sqlite_where=sa.text('is_read = 1'))
+
+
+def downgrade():
+    op.drop_index('ix_notifications_read_created_at', table_name='notifications')
+    op.drop_index('ix_notifications_archive_user_id', table_name='notifications_archive')
+    op.drop_table('notifications_archive')
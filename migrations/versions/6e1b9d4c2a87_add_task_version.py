@@ -0,0 +1,23 @@
+"""Add tasks.version for optimistic locking
+
+Revision ID: 6e1b9d4c2a87
+Revises: 9a3c7e5f4b21
+Create Date: 2025-11-28 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '6e1b9d4c2a87'
+down_revision = '9a3c7e5f4b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tasks', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('tasks', 'version')
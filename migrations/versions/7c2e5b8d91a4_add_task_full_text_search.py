@@ -0,0 +1,75 @@
+"""Add full-text search for tasks
+
+Revision ID: 7c2e5b8d91a4
+Revises: 3f1a9c2d7b40
+Create Date: 2025-11-24 15:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '7c2e5b8d91a4'
+down_revision = '3f1a9c2d7b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        # Generated column keeps the vector in sync on every insert/update
+        op.execute("""
+            ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(company_name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(title, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+            ) STORED
+        """)
+        with op.get_context().autocommit_block():
+            op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN (search_vector)")
+
+    elif dialect == 'sqlite':
+        # External-content FTS5 table kept in sync by triggers
+        op.execute("""
+            CREATE VIRTUAL TABLE tasks_fts USING fts5(
+                company_name, title, description,
+                content='tasks', content_rowid='id', tokenize='unicode61', prefix='2 3'
+            )
+        """)
+        op.execute("""
+            CREATE TRIGGER tasks_fts_ai AFTER INSERT ON tasks BEGIN
+                INSERT INTO tasks_fts(rowid, company_name, title, description)
+                VALUES (new.id, new.company_name, new.title, new.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER tasks_fts_ad AFTER DELETE ON tasks BEGIN
+                INSERT INTO tasks_fts(tasks_fts, rowid, company_name, title, description)
+                VALUES ('delete', old.id, old.company_name, old.title, old.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER tasks_fts_au AFTER UPDATE OF company_name, title, description ON tasks BEGIN
+                INSERT INTO tasks_fts(tasks_fts, rowid, company_name, title, description)
+                VALUES ('delete', old.id, old.company_name, old.title, old.description);
+                INSERT INTO tasks_fts(rowid, company_name, title, description)
+                VALUES (new.id, new.company_name, new.title, new.description);
+            END
+        """)
+        op.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_tasks_search_vector")
+        op.execute("ALTER TABLE tasks DROP COLUMN IF EXISTS search_vector")
+
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_ai")
+        op.execute("DROP TABLE IF EXISTS tasks_fts")
@@ -0,0 +1,25 @@
+"""Add repeat_count for coalesced notifications
+
+Revision ID: 9a3c7e5f4b21
+Revises: 5d2f8b6c1e03
+Create Date: 2025-11-27 13:45:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '9a3c7e5f4b21'
+down_revision = '5d2f8b6c1e03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('notifications', sa.Column('repeat_count', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('notifications_archive', sa.Column('repeat_count', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('notifications_archive', 'repeat_count')
+    op.drop_column('notifications', 'repeat_count')
@@ -0,0 +1,53 @@
+"""Add brand and edition task rollup tables
+
+Revision ID: a41d6e0f28c3
+Revises: 7c2e5b8d91a4
+Create Date: 2025-11-25 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a41d6e0f28c3'
+down_revision = '7c2e5b8d91a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('brand_stats',
+    sa.Column('brand_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('department', sa.String(length=50), nullable=False),
+    sa.Column('task_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['brand_id'], ['brands.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('brand_id', 'status', 'department')
+    )
+    op.create_table('edition_stats',
+    sa.Column('edition_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('department', sa.String(length=50), nullable=False),
+    sa.Column('task_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['edition_id'], ['editions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('edition_id', 'status', 'department')
+    )
+
+    # Backfill from existing tasks; `flask stats rebuild` does the same for drift repair
+    op.execute("""
+        INSERT INTO brand_stats (brand_id, status, department, task_count)
+        SELECT brand_id, coalesce(status, ''), coalesce(current_department, ''), count(*)
+        FROM tasks WHERE brand_id IS NOT NULL
+        GROUP BY brand_id, coalesce(status, ''), coalesce(current_department, '')
+    """)
+    op.execute("""
+        INSERT INTO edition_stats (edition_id, status, department, task_count)
+        SELECT edition_id, coalesce(status, ''), coalesce(current_department, ''), count(*)
+        FROM tasks WHERE edition_id IS NOT NULL
+        GROUP BY edition_id, coalesce(status, ''), coalesce(current_department, '')
+    """)
+
+
+def downgrade():
+    op.drop_table('edition_stats')
+    op.drop_table('brand_stats')
@@ -0,0 +1,25 @@
+"""Add preview_path to ads and task_files
+
+Revision ID: a7f2c8e4d016
+Revises: e5c9a1f7b3d2
+Create Date: 2025-12-01 14:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a7f2c8e4d016'
+down_revision = 'e5c9a1f7b3d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ads', sa.Column('preview_path', sa.String(length=500), nullable=True))
+    op.add_column('task_files', sa.Column('preview_path', sa.String(length=500), nullable=True))
+
+
+def downgrade():
+    op.drop_column('task_files', 'preview_path')
+    op.drop_column('ads', 'preview_path')
@@ -0,0 +1,27 @@
+"""Add cache_versions for the shared routing directory stamp
+
+Revision ID: b8d3f1a6c940
+Revises: 6e1b9d4c2a87
+Create Date: 2025-11-28 15:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b8d3f1a6c940'
+down_revision = '6e1b9d4c2a87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_versions',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_versions')
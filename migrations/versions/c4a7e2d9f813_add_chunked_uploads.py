@@ -0,0 +1,37 @@
+"""Add chunked_uploads for resumable uploads
+
+Revision ID: c4a7e2d9f813
+Revises: b8d3f1a6c940
+Create Date: 2025-11-29 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c4a7e2d9f813'
+down_revision = 'b8d3f1a6c940'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chunked_uploads',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('received', sa.BigInteger(), nullable=False, server_default='0'),
+    sa.Column('sha256', sa.String(length=64), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_chunked_uploads_user_id'), 'chunked_uploads', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_chunked_uploads_user_id'), table_name='chunked_uploads')
+    op.drop_table('chunked_uploads')
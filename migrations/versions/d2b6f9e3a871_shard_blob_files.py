@@ -0,0 +1,97 @@
+"""Move blobs and previews into two levels of hex-prefix directories
+
+Revision ID: d2b6f9e3a871
+Revises: a7f2c8e4d016
+Create Date: 2025-12-03 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+import logging
+import os
+import re
+import shutil
+
+
+revision = 'd2b6f9e3a871'
+down_revision = 'a7f2c8e4d016'
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger('alembic.env')
+
+FILE_TABLES = ('task_files', 'cxo_article_files', 'ads')
+PREVIEW_TABLES = ('task_files', 'ads')
+
+# A preview as the previous revision named it: the blob's SHA-256 and an extension
+PREVIEW_NAME = re.compile(r'^[0-9a-f]{64}\.\w+$')
+
+
+def _folders():
+    config = current_app.config
+    return (config.get('BLOB_FOLDER', 'app/static/uploads/blobs'),
+            config.get('PREVIEW_FOLDER', 'app/static/uploads/previews'))
+
+
+def _shard_path(folder, name):
+    return os.path.join(folder, name[:2], name[2:4], name)
+
+
+def _place(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    # A hard link costs no space while both names exist; copy across filesystems
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _relink(connection, to_shards):
+    """Link every blob and preview into the other layout and point the rows at it.
+
+    The files at the old names are left for after the commit: `flask blobs
+    shard` removes flat ones, and sharded ones are removed by hand.
+    """
+    blob_folder, preview_folder = _folders()
+    moved = 0
+    for (sha256,) in connection.execute(sa.text('SELECT sha256 FROM blobs')).all():
+        flat, sharded = os.path.join(blob_folder, sha256), _shard_path(blob_folder, sha256)
+        src, dst = (flat, sharded) if to_shards else (sharded, flat)
+        if os.path.isfile(src) and not os.path.exists(dst):
+            _place(src, dst)
+        if not os.path.exists(dst):
+            continue
+        for table in FILE_TABLES:
+            rows = sa.table(table, sa.column('file_path'), sa.column('blob_sha256'))
+            connection.execute(rows.update().where(rows.c.blob_sha256 == sha256).values(file_path=dst))
+        moved += 1
+
+    previews = []
+    if to_shards and os.path.isdir(preview_folder):
+        previews = [name for name in os.listdir(preview_folder) if PREVIEW_NAME.match(name)]
+    elif os.path.isdir(preview_folder):
+        for root, _, names in os.walk(preview_folder):
+            if root != preview_folder:
+                previews += [name for name in names if PREVIEW_NAME.match(name)]
+    for name in previews:
+        flat, sharded = os.path.join(preview_folder, name), _shard_path(preview_folder, name)
+        src, dst = (flat, sharded) if to_shards else (sharded, flat)
+        if not os.path.exists(dst):
+            _place(src, dst)
+        for table in PREVIEW_TABLES:
+            rows = sa.table(table, sa.column('preview_path'))
+            connection.execute(rows.update().where(rows.c.preview_path == src).values(preview_path=dst))
+    return moved, len(previews)
+
+
+def upgrade():
+    blobs, previews = _relink(op.get_bind(), to_shards=True)
+    log.info('Linked %d blobs and %d previews into the sharded layout; '
+             '`flask blobs shard` removes the flat copies.', blobs, previews)
+
+
+def downgrade():
+    blobs, previews = _relink(op.get_bind(), to_shards=False)
+    log.info('Linked %d blobs and %d previews back into the flat layout; '
+             'remove the two-level directories once the downgrade is committed.', blobs, previews)
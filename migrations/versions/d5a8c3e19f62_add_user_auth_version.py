@@ -0,0 +1,23 @@
+"""add auth version to users
+
+Revision ID: d5a8c3e19f62
+Revises: a41d6e0f28c3
+Create Date: 2025-11-25 15:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd5a8c3e19f62'
+down_revision = 'a41d6e0f28c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('auth_version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('users', 'auth_version')
@@ -0,0 +1,132 @@
+"""Add content-addressed blobs; hash and dedupe existing uploads
+
+Revision ID: e5c9a1f7b3d2
+Revises: c4a7e2d9f813
+Create Date: 2025-11-30 10:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+from datetime import datetime
+import hashlib
+import logging
+import os
+import shutil
+
+
+revision = 'e5c9a1f7b3d2'
+down_revision = 'c4a7e2d9f813'
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger('alembic.env')
+
+# Tables whose rows point at uploaded files: the column with the name each file
+# was saved under, and the folder it was saved in before the blob store
+FILE_TABLES = (
+    ('task_files', 'filename', 'app/static/uploads/tasks'),
+    ('cxo_article_files', 'stored_filename', 'app/static/uploads/cxo_articles'),
+    ('ads', 'filename', 'app/static/uploads/ads'),
+)
+
+
+def _blob_folder():
+    return current_app.config.get('BLOB_FOLDER', 'app/static/uploads/blobs')
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _place(src, dst):
+    # A hard link costs no space while both names exist; copy across filesystems
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def upgrade():
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    for table, _, _ in FILE_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('blob_sha256', sa.String(length=64), nullable=True))
+            batch_op.create_foreign_key(f'fk_{table}_blob_sha256', 'blobs', ['blob_sha256'], ['sha256'])
+            batch_op.create_index(op.f(f'ix_{table}_blob_sha256'), ['blob_sha256'], unique=False)
+
+    # Hash every file already on disk and link one copy per distinct content in.
+    # Nothing is removed here: should the transaction fail, the rows still point
+    # at the originals. `flask blobs gc` removes them once their blob is in place.
+    connection = op.get_bind()
+    folder = _blob_folder()
+    os.makedirs(folder, exist_ok=True)
+    blobs = {}
+    hashed = {}
+    updates = []
+    missing = 0
+    for table, _, _ in FILE_TABLES:
+        rows = sa.table(table, sa.column('id'), sa.column('file_path'), sa.column('blob_sha256'))
+        for row_id, file_path in connection.execute(sa.select(rows.c.id, rows.c.file_path)).all():
+            if not file_path or not os.path.isfile(file_path):
+                missing += 1
+                continue
+            if file_path not in hashed:
+                hashed[file_path] = _hash_file(file_path)
+            sha256 = hashed[file_path]
+            blob_path = os.path.join(folder, sha256)
+            if sha256 not in blobs:
+                blobs[sha256] = [os.path.getsize(file_path), 0]
+                if not os.path.exists(blob_path):
+                    _place(file_path, blob_path)
+            blobs[sha256][1] += 1
+            updates.append((rows, row_id, blob_path, sha256))
+
+    # Blob rows first: Postgres checks the rows' new foreign keys as they are written
+    blob_table = sa.table('blobs', sa.column('sha256'), sa.column('size'), sa.column('ref_count'), sa.column('created_at'))
+    now = datetime.utcnow()
+    for sha256, (size, ref_count) in blobs.items():
+        connection.execute(blob_table.insert().values(sha256=sha256, size=size, ref_count=ref_count, created_at=now))
+    for rows, row_id, blob_path, sha256 in updates:
+        connection.execute(
+            rows.update().where(rows.c.id == row_id).values(file_path=blob_path, blob_sha256=sha256)
+        )
+
+    log.info('Stored %d files as %d blobs; %d rows had no file on disk. Run `flask blobs gc` to remove the originals.',
+             len(hashed), len(blobs), missing)
+
+
+def downgrade():
+    # Give every row its own copy again, under the name it had before
+    connection = op.get_bind()
+    folder = _blob_folder()
+    for table, name_column, upload_folder in FILE_TABLES:
+        rows = sa.table(table, sa.column('id'), sa.column(name_column), sa.column('blob_sha256'), sa.column('file_path'))
+        os.makedirs(upload_folder, exist_ok=True)
+        for row_id, name, sha256 in connection.execute(
+            sa.select(rows.c.id, rows.c[name_column], rows.c.blob_sha256).where(rows.c.blob_sha256.isnot(None))
+        ).all():
+            blob_path = os.path.join(folder, sha256)
+            file_path = os.path.join(upload_folder, name)
+            if os.path.isfile(blob_path) and not os.path.exists(file_path):
+                _place(blob_path, file_path)
+            connection.execute(rows.update().where(rows.c.id == row_id).values(file_path=file_path))
+
+    for table, _, _ in reversed(FILE_TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index(op.f(f'ix_{table}_blob_sha256'))
+            batch_op.drop_constraint(f'fk_{table}_blob_sha256', type_='foreignkey')
+            batch_op.drop_column('blob_sha256')
+    op.drop_table('blobs')
+    # Left in place for the same reason as the originals on upgrade
+    log.info('Copied uploads back out of %s; remove it once the downgrade is committed.', folder)
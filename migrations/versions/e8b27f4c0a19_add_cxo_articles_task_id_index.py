@@ -0,0 +1,28 @@
+"""Index cxo_articles.task_id
+
+Revision ID: e8b27f4c0a19
+Revises: d5a8c3e19f62
+Create Date: 2025-11-26 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e8b27f4c0a19'
+down_revision = 'd5a8c3e19f62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index('ix_cxo_articles_task_id', 'cxo_articles', ['task_id'],
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index('ix_cxo_articles_task_id', 'cxo_articles', ['task_id'])
+
+
+def downgrade():
+    op.drop_index('ix_cxo_articles_task_id', table_name='cxo_articles')
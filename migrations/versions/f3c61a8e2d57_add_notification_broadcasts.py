@@ -0,0 +1,42 @@
+"""Add team notification broadcasts and read receipts
+
+Revision ID: f3c61a8e2d57
+Revises: e8b27f4c0a19
+Create Date: 2025-11-26 14:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f3c61a8e2d57'
+down_revision = 'e8b27f4c0a19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_broadcasts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('team', sa.String(length=50), nullable=False),
+    sa.Column('task_id', sa.Integer(), nullable=True),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notification_broadcasts_team_created_at', 'notification_broadcasts', ['team', 'created_at'])
+    op.create_table('notification_receipts',
+    sa.Column('broadcast_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['broadcast_id'], ['notification_broadcasts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('broadcast_id', 'user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('notification_receipts')
+    op.drop_index('ix_notification_broadcasts_team_created_at', table_name='notification_broadcasts')
+    op.drop_table('notification_broadcasts')
@@ -2,8 +2,8 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from app import create_app, db
-from app.models import User, Brand, Edition, Task, TaskHistory, TaskFile, CXOArticle, Ad, Notification
+from app import create_app, db, blobs
+from app.models import User, Brand, Edition, Task, TaskHistory, TaskFile, CXOArticle, Ad, Notification, NotificationBroadcast, NotificationReceipt, NotificationCounter, NotificationArchive, BrandStats, EditionStats
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
 import random
@@ -15,6 +15,12 @@ def seed_comprehensive_data():
         TaskFile.query.delete()
         TaskHistory.query.delete()
         Notification.query.delete()
+        NotificationReceipt.query.delete()
+        NotificationBroadcast.query.delete()
+        NotificationCounter.query.delete()
+        NotificationArchive.query.delete()
+        BrandStats.query.delete()
+        EditionStats.query.delete()
         Task.query.delete()
         CXOArticle.query.delete()
         Ad.query.delete()
@@ -22,6 +28,8 @@ def seed_comprehensive_data():
         Brand.query.delete()
         User.query.delete()
         db.session.commit()
+        # Files were bulk-deleted behind the blob reference counts' back
+        blobs.recount()
         
         print("Creating users with managers...")
         default_password = generate_password_hash('password123')
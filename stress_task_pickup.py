@@ -0,0 +1,217 @@
+"""Concurrency stress test for task pickup and optimistic locking (app/workflow.py).
+
+Usage:
+    python stress_task_pickup.py                      # 16 threads race for 200 open tasks
+    python stress_task_pickup.py --threads 32 --tasks 1000
+    DATABASE_URL=postgresql://... python stress_task_pickup.py --database-url-from-env
+
+By default runs against a throwaway SQLite file, where writers take turns; point
+it at a scratch Postgres database (it creates and fills the tables) to see
+real row-level races. Two phases, each thread acting as a different editor:
+
+1. pickup: every thread tries to pick up every task of the same open pool, in
+   its own random order. Each task must end up picked up exactly once.
+2. stale reassign: every thread reads the pool, then reassigns every task with
+   the version it read, as a form left open in several tabs would. Exactly one
+   reassign per task may win; the rest must be refused, not overwrite it.
+
+Exits non-zero if either phase lost or duplicated an update.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import argparse
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+
+from app import create_app, db, workflow
+from app.models import User, Brand, Edition, Task, TaskHistory, BrandStats
+from config import Config
+
+
+def make_config(database_url):
+    class StressConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        # Enough connections for every thread, and SQLite waits for the write lock instead of failing
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 64, 'max_overflow': 0}
+        if database_url.startswith('sqlite'):
+            SQLALCHEMY_ENGINE_OPTIONS = dict(SQLALCHEMY_ENGINE_OPTIONS, connect_args={'timeout': 60})
+    return StressConfig
+
+
+def seed(threads, count):
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(replit_user_id='stress_manager', username='stress_manager', role='editorial',
+                        department='editorial', is_manager=True))
+    sales = User(replit_user_id='stress_sales', username='stress_sales', role='sales', department='sales')
+    editors = [
+        User(replit_user_id=f'stress_editor_{i}', username=f'stress_editor_{i}', role='editorial', department='editorial')
+        for i in range(threads)
+    ]
+    db.session.add_all([sales] + editors)
+    edition = Edition(brand=Brand(name='Stress Brand'), name='Stress Edition')
+    db.session.add(edition)
+    db.session.flush()
+
+    for i in range(count):
+        db.session.add(Task(
+            brand_id=edition.brand_id,
+            edition_id=edition.id,
+            created_by_id=sales.id,
+            assigned_department='editorial',
+            current_department='editorial',
+            status='Open',
+            company_name=f'Stress Co {i}',
+            description='Pickup stress task'
+        ))
+    db.session.commit()
+    return [editor.id for editor in editors]
+
+
+def race(app, editor_ids, attempt):
+    """Run attempt(actor_id, results) on one thread per editor, all released at once."""
+    start = threading.Barrier(len(editor_ids))
+    results = defaultdict(list)
+    failures = []
+
+    def worker(actor_id):
+        with app.app_context():
+            start.wait()
+            try:
+                attempt(actor_id, results)
+            except Exception as error:
+                failures.append(repr(error))
+            finally:
+                db.session.remove()
+
+    workers = [threading.Thread(target=worker, args=(actor_id,)) for actor_id in editor_ids]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results, failures, time.perf_counter() - started
+
+
+def pickup_phase(app, editor_ids, task_ids):
+    def attempt(actor_id, results):
+        order = list(task_ids)
+        random.shuffle(order)
+        actor = db.session.get(User, actor_id)
+        for task_id in order:
+            try:
+                workflow.run('pickup', workflow.load_task(task_id), actor)
+                results[task_id].append(actor_id)
+            except workflow.TransitionError as error:
+                results['refused'].append(error.message)
+            db.session.expire_all()
+
+    results, failures, elapsed = race(app, editor_ids, attempt)
+    problems = list(failures)
+    with app.app_context():
+        owners = dict(db.session.query(Task.id, Task.assigned_to_id))
+        pickups = Counter(task_id for (task_id,) in db.session.query(TaskHistory.task_id).filter_by(action='Task Picked Up'))
+    for task_id in task_ids:
+        winners = results.get(task_id, [])
+        if len(winners) != 1:
+            problems.append(f'task #{task_id} picked up {len(winners)} times')
+        elif owners[task_id] != winners[0] or pickups[task_id] != 1:
+            problems.append(f'task #{task_id} owned by {owners[task_id]}, picked up by {winners[0]}, {pickups[task_id]} history rows')
+
+    attempts = len(editor_ids) * len(task_ids)
+    print(f'pickup:         {attempts} attempts in {elapsed:.2f}s ({attempts / elapsed:,.0f}/s), '
+          f'{len(task_ids)} won, {len(results["refused"])} refused, {Counter(results["refused"]).most_common(2)}')
+    return problems
+
+
+def stale_reassign_phase(app, editor_ids, task_ids):
+    with app.app_context():
+        # The version every thread's "form" was rendered with
+        seen = dict(db.session.query(Task.id, Task.version))
+
+    def attempt(actor_id, results):
+        order = list(task_ids)
+        random.shuffle(order)
+        actor = db.session.get(User, actor_id)
+        for task_id in order:
+            params = {'department': 'editorial', 'version': str(seen[task_id]), 'comment': f'by {actor_id}'}
+            try:
+                workflow.run('reassign', workflow.load_task(task_id), actor, params)
+                results[task_id].append(actor_id)
+            except workflow.TransitionError as error:
+                results['refused'].append(error.message)
+            db.session.expire_all()
+
+    results, failures, elapsed = race(app, editor_ids, attempt)
+    problems = list(failures)
+    with app.app_context():
+        versions = dict(db.session.query(Task.id, Task.version))
+        history = Counter(task_id for (task_id,) in db.session.query(TaskHistory.task_id))
+    for task_id in task_ids:
+        winners = results.get(task_id, [])
+        if len(winners) != 1:
+            problems.append(f'task #{task_id} reassigned {len(winners)} times from version {seen[task_id]}')
+        # Created at 1, then one version per committed transition: nothing was written over
+        if versions[task_id] != 1 + history[task_id]:
+            problems.append(f'task #{task_id} at version {versions[task_id]} after {history[task_id]} transitions')
+
+    attempts = len(editor_ids) * len(task_ids)
+    print(f'stale reassign: {attempts} attempts in {elapsed:.2f}s ({attempts / elapsed:,.0f}/s), '
+          f'{sum(len(w) for k, w in results.items() if k != "refused")} won, {len(results["refused"])} refused')
+    return problems
+
+
+def check_rollups(app):
+    with app.app_context():
+        counted = dict(db.session.query(Task.status, func.count()).group_by(Task.status))
+        rolled_up = {
+            status: total for status, total in
+            db.session.query(BrandStats.status, func.sum(BrandStats.task_count)).group_by(BrandStats.status)
+            if total
+        }
+    if counted != rolled_up:
+        return [f'brand rollups {rolled_up} do not match task counts {counted}']
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16, help='concurrent editors')
+    parser.add_argument('--tasks', type=int, default=200, help='open tasks in the pool')
+    parser.add_argument('--database-url-from-env', action='store_true',
+                        help='use DATABASE_URL (its tables are dropped and recreated) instead of a temporary SQLite file')
+    args = parser.parse_args()
+
+    if args.database_url_from_env:
+        database_url = os.environ['DATABASE_URL']
+    else:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db')
+
+    app = create_app(make_config(database_url))
+    with app.app_context():
+        editor_ids = seed(args.threads, args.tasks)
+        task_ids = [task_id for (task_id,) in db.session.query(Task.id).order_by(Task.id)]
+    print(f'{args.threads} threads, {args.tasks} tasks on {make_url(database_url).get_backend_name()}')
+
+    problems = pickup_phase(app, editor_ids, task_ids)
+    problems += stale_reassign_phase(app, editor_ids, task_ids)
+    problems += check_rollups(app)
+
+    if problems:
+        print(f'\n{len(problems)} problems:')
+        for problem in problems[:20]:
+            print(f'  {problem}')
+        sys.exit(1)
+    print('\nNo lost or duplicated updates.')
+
+
+if __name__ == '__main__':
+    main()